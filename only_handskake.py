@@ -10,7 +10,7 @@ Cihaz: Topway / ESC/POS uyumlu (senin model – ESC 0x56 işe yaramadı, GS v 0
 - GS v 0 ile tek seferde tam bitmap gönderimi
 - 50x50 mm içerik + 20 mm alt boşluk (toplam 70 mm) varsayılan
 - 180° rotate (varsayılan açık, kapatmak için --no-rotate)
-- CODE128 barkod (python-barcode varsa), yoksa pseudo fallback
+- CODE128 / GS1-128 barkod (yerleşik kodlayıcı, A/B/C otomatik geçiş, tam sayı modül genişliği)
 - DOT per mm 8 veya 12 seçilebilir (varsayılan 8; siyah blok genişliğini ölçerek doğrula)
 - İsteğe bağlı siyah test bloğu (--black-test) (handshake sonrası)
 - Parametresiz çalışır (default test verisi)
@@ -35,18 +35,22 @@ NOTLAR
     * ~70 mm ise seçtiğin dot/mm doğru.
     * ~46-47 mm civarı çıkıyorsa aslında kafa 70 mm * 12 dot/mm -> 840 dot; sen 8 kullanmışsın → 12’ye geç.
 - Handshake tek sefer port açılınca yapılır. Aynı program içinde ardışık baskılar için tekrar gerekmez.
-- Barkod okutulmazsa threshold düşür (–threshold 170) veya module_width değiştir (kodu içinde ayar).
+- Barkod okutulmazsa threshold düşür (–threshold 170) veya --barcode-module-width (mm) büyüt.
+- GS1-128 için --gs1 ve AI'ları parantezle ver: --barcode "(01)08684617390154(3103)000750(10)LOT42"
 
 GEREKSİNİMLER
 -------------
-pip install pillow pyserial python-barcode
-(Barcode kütüphanesi yoksa pseudo bir desen basar – üretim için gerçek kütüphaneyi kur.)
+pip install pillow pyserial
 
 """
 
+import os
 import sys
+import json
 import time
+import queue
 import argparse
+import threading
 from dataclasses import dataclass, field
 from typing import List, Optional, Tuple
 
@@ -54,16 +58,13 @@ from PIL import Image, ImageDraw, ImageFont
 
 try:
     import serial
+    from serial.tools import list_ports
 except ImportError:
     serial = None
+    list_ports = None
 
-# Barkod opsiyonel:
-try:
-    from barcode import Code128
-    from barcode.writer import ImageWriter
-    HAVE_PYTHON_BARCODE = True
-except ImportError:
-    HAVE_PYTHON_BARCODE = False
+# serial3'ün müzakere edip kaydettiği yazıcı hızı (serial2 ile aynı dosya ve anahtar)
+PRN_BAUD_CACHE_PATH = os.getenv("PRN_BAUD_CACHE", "printer_baud.json")
 
 
 # ===================== VERİ SINIFLARI =====================
@@ -97,12 +98,117 @@ class Config:
     black_test: bool = False
     font_scale: float = 1.0
     left_content_mm: Optional[float] = None
-    barcode_module_width: float = 0.25  # python-barcode module_width
+    barcode_module_width: float = 0.25  # mm; tam sayı noktaya yuvarlanır
+    barcode_gs1: bool = False           # barkod değeri GS1 AI'ları: "(01)...(3103)...(10)..."
     handshake_delay: float = 0.05       # her alt komut sonrası bekleme
+    skip_blank: bool = False            # boş satırları ESC J ile geç, beyaz sütunları kırp
+    blank_run_min_rows: int = 8         # daha kısa boş koşular banda dahil edilir
+    stream_band_rows: int = 0           # >0: bitmap bu yükseklikte bantlar halinde paketlenip gönderilir
+
+
+# ===================== RASTER KOMUTLARI =====================
+
+def gs_v0_header(w_bytes: int, h: int) -> bytes:
+    # GS v 0: (1D 76 30 m xL xH yL yH [data])
+    return bytes([
+        0x1D, 0x76, 0x30, 0x00,
+        w_bytes & 0xFF, (w_bytes >> 8) & 0xFF,
+        h & 0xFF, (h >> 8) & 0xFF
+    ])
+
+
+def feed_dots_command(dots: int) -> bytes:
+    # ESC J n: n nokta kağıt besle (n <= 255)
+    out = bytearray()
+    while dots > 0:
+        n = min(255, dots)
+        out += bytes([0x1B, 0x4A, n])
+        dots -= n
+    return bytes(out)
+
+
+def set_left_margin_command(dots: int) -> bytes:
+    # GS L nL nH: sol kenar boşluğu (nokta)
+    return bytes([0x1D, 0x4C, dots & 0xFF, (dots >> 8) & 0xFF])
+
+
+def pack_1bit_rows(gray: Image.Image, threshold: int, y0: int = 0, y1: Optional[int] = None) -> bytes:
+    """L görüntünün [y0, y1) satırlarını MSB-first 1-bit pakete çevirir (1 = siyah nokta)."""
+    if y1 is None:
+        y1 = gray.height
+    part = gray if (y0 == 0 and y1 == gray.height) else gray.crop((0, y0, gray.width, y1))
+    lut = [255 if v < threshold else 0 for v in range(256)]
+    return part.point(lut, "1").tobytes("raw", "1")
+
+
+def raster_bands(view, row_bytes: int, rows: int, min_blank_rows: int = 8) -> List[Tuple[int, int, bool]]:
+    """
+    Raster'ı (başlangıç, bitiş, boş_mu) satır aralıklarına böler. Hiç nokta içermeyen satırlar boştur;
+    min_blank_rows'tan kısa boş koşular mürekkepli banda katılır.
+    """
+    view = memoryview(view)
+    zero_row = bytes(row_bytes)
+    bands: List[Tuple[int, int, bool]] = []
+    start = 0
+    cur_blank = None
+    for r in range(rows):
+        off = r * row_bytes
+        blank = view[off:off + row_bytes] == zero_row
+        if cur_blank is None:
+            cur_blank = blank
+        elif blank != cur_blank:
+            bands.append((start, r, cur_blank))
+            start, cur_blank = r, blank
+    if rows:
+        bands.append((start, rows, bool(cur_blank)))
+
+    merged: List[Tuple[int, int, bool]] = []
+    for b0, b1, blank in bands:
+        if blank and (b1 - b0) < min_blank_rows:
+            blank = False
+        if merged and merged[-1][2] == blank:
+            merged[-1] = (merged[-1][0], b1, blank)
+        else:
+            merged.append((b0, b1, blank))
+    return merged
+
+
+def ink_byte_span(view, row_bytes: int, r0: int, r1: int) -> Tuple[int, int]:
+    # Banttaki satırların OR'u: ilk ve son mürekkepli bayt sütunu [sol, sağ)
+    acc = 0
+    for r in range(r0, r1):
+        off = r * row_bytes
+        acc |= int.from_bytes(view[off:off + row_bytes], "big")
+    if not acc:
+        return 0, 0
+    total_bits = row_bytes * 8
+    left = (total_bits - acc.bit_length()) // 8
+    right = row_bytes - (((acc & -acc).bit_length() - 1) // 8)
+    return left, right
 
 
 # ===================== SERİ ARAYÜZ / HANDSHAKE =====================
 
+def printer_device_key(port: str) -> str:
+    # serial3 ile aynı anahtar: mümkünse VID:PID:seri no, değilse port yolu
+    try:
+        for p in list_ports.comports():
+            if p.device == port and p.vid is not None:
+                return f"{p.vid:04x}:{p.pid:04x}:{p.serial_number or port}"
+    except Exception:
+        pass
+    return port
+
+
+def load_saved_printer_baud(port: str) -> Optional[int]:
+    try:
+        with open(PRN_BAUD_CACHE_PATH, "r", encoding="utf-8") as f:
+            v = json.load(f).get(printer_device_key(port))
+        return int(v) if v else None
+    except Exception:
+        return None
+
+
 class Printer:
     def __init__(self, cfg: Config):
         if serial is None:
@@ -123,15 +229,15 @@ class Printer:
         except:
             pass
 
-    def _send(self, data: bytes, desc=""):
+    def _send(self, data: bytes, desc="", delay: Optional[float] = None):
         self.ser.write(data)
         self.ser.flush()
         if self.cfg.debug:
             if len(data) <= 64:
-                print(f"[TX {desc}] {data.hex(' ')}")
+                print(f"[TX {desc}] {bytes(data).hex(' ')}")
             else:
-                print(f"[TX {desc}] {len(data)} bytes (head={data[:32].hex()})")
-        time.sleep(self.cfg.handshake_delay)
+                print(f"[TX {desc}] {len(data)} bytes (head={bytes(data[:32]).hex()})")
+        time.sleep(self.cfg.handshake_delay if delay is None else delay)
 
     def handshake(self):
         # 1) Reset + senkron AA55 (senin cihaz için gerekli)
@@ -151,88 +257,276 @@ class Printer:
             print("[INFO] Handshake tamamlandı.")
 
     # GS v 0: (1D 76 30 m xL xH yL yH [data])
-    def send_gs_v0_bitmap(self, img: Image.Image):
+    def send_gs_v0_bitmap(self, img: Image.Image) -> dict:
         w = img.width
         h = img.height
         w_bytes = (w + 7) // 8
 
-        # 1-bit paket hazırlama
         gray = img.convert("L")
-        px = gray.load()
-        buf = bytearray(w_bytes * h)
-        threshold = self.cfg.threshold
-        for y in range(h):
-            byte = 0
-            bit = 7
-            base = y * w_bytes
-            out = 0
-            for x in range(w):
-                if px[x, y] < threshold:
-                    byte |= (1 << bit)
-                bit -= 1
-                if bit < 0:
-                    buf[base + out] = byte
-                    out += 1
-                    byte = 0
-                    bit = 7
-            if bit != 7:
-                buf[base + out] = byte  # kalan
-        header = bytes([
-            0x1D, 0x76, 0x30, 0x00,
-            w_bytes & 0xFF, (w_bytes >> 8) & 0xFF,
-            h & 0xFF, (h >> 8) & 0xFF
-        ])
+        if self.cfg.stream_band_rows > 0:
+            return self._send_gs_v0_streamed(gray, w_bytes, h)
+
+        # 1-bit paket hazırlama (Pillow ile toplu)
+        buf = pack_1bit_rows(gray, self.cfg.threshold)
+        if self.cfg.skip_blank:
+            return self._send_gs_v0_bands(buf, w_bytes, h)
+        header = gs_v0_header(w_bytes, h)
         self._send(header + buf, "GSv0-bitmap")
+        return {"bytes": len(header) + len(buf), "full_bytes": len(header) + len(buf), "saved": 0, "bands": 1}
+
+    def _send_gs_v0_streamed(self, gray: Image.Image, w_bytes: int, h: int) -> dict:
+        """
+        Bitmap'i stream_band_rows yükseklikte bantlara bölüp her bandı kendi GS v 0 komutuyla gönderir.
+        Yazma ayrı iş parçacığında yapılır: bant N portta giderken bant N+1 paketlenir.
+        """
+        rows = self.cfg.stream_band_rows
+        q: "queue.Queue[Optional[Tuple[int, bytes]]]" = queue.Queue(maxsize=2)
+        stats = {"bytes": 0, "full_bytes": 8 + w_bytes * h, "saved": 0, "bands": 0}
+        errors: List[BaseException] = []
+
+        def writer():
+            while True:
+                item = q.get()
+                if item is None:
+                    return
+                if errors:
+                    continue
+                y0, band = item
+                n = len(band) // w_bytes
+                try:
+                    if self.cfg.skip_blank:
+                        st = self._send_gs_v0_bands(band, w_bytes, n, quiet=True)
+                        stats["bytes"] += st["bytes"]
+                        stats["bands"] += st["bands"]
+                    else:
+                        header = gs_v0_header(w_bytes, n)
+                        self._send(header + band, f"GSv0-stream {y0}-{y0 + n}", delay=0)
+                        stats["bytes"] += len(header) + len(band)
+                        stats["bands"] += 1
+                except BaseException as e:
+                    errors.append(e)
+
+        t = threading.Thread(target=writer, name="GSv0Writer", daemon=True)
+        t.start()
+        try:
+            for y0 in range(0, h, rows):
+                if errors:
+                    break
+                q.put((y0, pack_1bit_rows(gray, self.cfg.threshold, y0, min(h, y0 + rows))))
+        finally:
+            q.put(None)
+            t.join()
+        if errors:
+            raise errors[0]
+        stats["saved"] = stats["full_bytes"] - stats["bytes"]
+        if self.cfg.debug:
+            print(f"[INFO] Akış modu: {stats['bytes']} bayt, {stats['bands']} bant")
+        return stats
+
+    def _send_gs_v0_bands(self, buf: bytes, w_bytes: int, h: int, quiet: bool = False) -> dict:
+        """
+        Boş satır koşularını ESC J ile besler; her mürekkepli bandı beyaz sütunlarından kırpıp
+        GS L (sol kenar boşluğu) + kendi GS v 0 komutuyla gönderir.
+        """
+        view = memoryview(buf)
+        bands = raster_bands(view, w_bytes, h, self.cfg.blank_run_min_rows)
+        sent = 0
+        for b0, b1, blank in bands:
+            if blank:
+                cmd = feed_dots_command(b1 - b0)
+                self._send(cmd, f"feed {b1 - b0}", delay=0)
+                sent += len(cmd)
+                continue
+            left, right = ink_byte_span(view, w_bytes, b0, b1)
+            bw = right - left
+            data = bytearray(bw * (b1 - b0))
+            for i, r in enumerate(range(b0, b1)):
+                off = r * w_bytes
+                data[i * bw:(i + 1) * bw] = view[off + left:off + right]
+            cmd = set_left_margin_command(left * 8) + gs_v0_header(bw, b1 - b0)
+            self._send(cmd + data, f"GSv0-band {b0}-{b1} x{left}-{right}", delay=0)
+            sent += len(cmd) + len(data)
+        reset = set_left_margin_command(0)
+        self._send(reset, "left-margin-reset", delay=0)
+        sent += len(reset)
+        full = 8 + len(buf)
+        stats = {"bytes": sent, "full_bytes": full, "saved": full - sent, "bands": len(bands)}
+        if self.cfg.debug and not quiet:
+            print(f"[INFO] Bant modu: {sent}/{full} bayt, {full - sent} bayt tasarruf ({len(bands)} bant)")
+        return stats
 
     def feed(self, lines=3):
         self._send(b"\n" * lines, "feed")
 
     def black_test_block(self, width_dots: int, height: int = 64):
         w_bytes = (width_dots + 7) // 8
-        header = bytes([
-            0x1D, 0x76, 0x30, 0x00,
-            w_bytes & 0xFF, (w_bytes >> 8) & 0xFF,
-            height & 0xFF, (height >> 8) & 0xFF
-        ])
+        header = gs_v0_header(w_bytes, height)
         data = bytes([0xFF]) * (w_bytes * height)
         self._send(header + data, "black-block")
 
 
 # ===================== BARKOD =====================
 
-def build_code128(barcode_value: str, width_px: int, height_px: int, module_width: float) -> Image.Image:
+# Code128 desenleri: değer -> çubuk/boşluk genişlikleri (modül). 106 = STOP (13 modül).
+CODE128_PATTERNS = [
+    "212222", "222122", "222221", "121223", "121322", "131222", "122213", "122312", "132212", "221213",
+    "221312", "231212", "112232", "122132", "122231", "113222", "123122", "123221", "223211", "221132",
+    "221231", "213212", "223112", "312131", "311222", "321122", "321221", "312212", "322112", "322211",
+    "212123", "212321", "232121", "111323", "131123", "131321", "112313", "132113", "132311", "211313",
+    "231113", "231311", "112133", "112331", "132131", "113123", "113321", "133121", "313121", "211331",
+    "231131", "213113", "213311", "213131", "311123", "311321", "331121", "312113", "312311", "332111",
+    "314111", "221411", "431111", "111224", "111422", "121124", "121421", "141122", "141221", "112214",
+    "112412", "122114", "122411", "142112", "142211", "241211", "221114", "413111", "241112", "134111",
+    "111242", "121142", "121241", "114212", "124112", "124211", "411212", "421112", "421211", "212141",
+    "214121", "412121", "111143", "111341", "131141", "114113", "114311", "411113", "411311", "113141",
+    "114131", "311141", "411131", "211412", "211214", "211232", "2331112",
+]
+C128_SHIFT, C128_CODE_C, C128_CODE_B, C128_CODE_A, C128_FNC1 = 98, 99, 100, 101, 102
+C128_START = {"A": 103, "B": 104, "C": 105}
+C128_STOP = 106
+C128_SWITCH = {"A": C128_CODE_A, "B": C128_CODE_B, "C": C128_CODE_C}
+FNC1 = "\xf1"  # girişte FNC1 yer tutucusu
+
+# Uzunluğu önceden tanımlı GS1 AI'ları (ilk iki hane -> AI dahil toplam uzunluk); bunlardan sonra FNC1 gerekmez
+GS1_PREDEFINED_LENGTH = {
+    "00": 20, "01": 16, "02": 16, "03": 16, "04": 18,
+    "11": 8, "12": 8, "13": 8, "14": 8, "15": 8, "16": 8, "17": 8, "18": 8, "19": 8, "20": 4,
+    "31": 10, "32": 10, "33": 10, "34": 10, "35": 10, "36": 10, "41": 16,
+}
+
+
+def gs1_to_code128_data(text: str) -> str:
+    """
+    "(01)08684617390154(3103)000750(10)LOT42" -> FNC1 + alanlar. Değişken uzunluklu alanlar
+    son alan değilse FNC1 ile sonlandırılır.
+    """
+    parts = []
+    i = 0
+    while i < len(text):
+        if text[i] != "(":
+            raise ValueError(f"GS1: '(' bekleniyordu: {text[i:]!r}")
+        j = text.index(")", i)
+        ai = text[i + 1:j]
+        k = text.find("(", j + 1)
+        k = len(text) if k < 0 else k
+        value = text[j + 1:k]
+        if not ai.isdigit() or not value:
+            raise ValueError(f"GS1: geçersiz alan ({ai}){value}")
+        parts.append((ai, value))
+        i = k
+    out = FNC1
+    for n, (ai, value) in enumerate(parts):
+        field = ai + value
+        fixed = GS1_PREDEFINED_LENGTH.get(ai[:2])
+        if fixed is not None and len(field) != fixed:
+            raise ValueError(f"GS1: ({ai}) alanı {fixed - len(ai)} karakter olmalı")
+        out += field
+        if fixed is None and n < len(parts) - 1:
+            out += FNC1
+    return out
+
+
+def _c128_value(ch: str, code_set: str) -> Optional[int]:
+    if ch == FNC1:
+        return C128_FNC1
+    o = ord(ch)
+    if code_set == "A":
+        if o < 32:
+            return o + 64
+        return o - 32 if o < 96 else None
+    if code_set == "B":
+        return o - 32 if 32 <= o < 128 else None
+    return None
+
+
+def code128_encode(data: str) -> List[int]:
+    """
+    Veriyi en az kod sözcüğüyle Code128 değerlerine çevirir (START, veri, kontrol, STOP).
+    A/B/C arası geçiş ve tek karakterlik SHIFT dinamik programlamayla seçilir; C'de iki hane tek sözcüktür.
+    """
+    n = len(data)
+    INF = float("inf")
+    sets = ("A", "B", "C")
+    # cost[i][s]: data[i:]'yi s kümesindeyken kodlamanın en az sözcük sayısı; step: (ilerleme, yeni küme, sözcükler)
+    cost = [dict.fromkeys(sets, INF) for _ in range(n + 1)]
+    step: List[dict] = [dict() for _ in range(n + 1)]
+    for s_ in sets:
+        cost[n][s_] = 0
+    for i in range(n - 1, -1, -1):
+        ch = data[i]
+        # Önce küme içi kodlama, sonra (bir sözcük pahasına) küme değiştirerek
+        for s_ in sets:
+            best, how = INF, None
+            if s_ == "C":
+                if ch == FNC1:
+                    best, how = 1 + cost[i + 1]["C"], (1, "C", [C128_FNC1])
+                elif i + 1 < n and ch.isdigit() and data[i + 1].isdigit() and ch.isascii() and data[i + 1].isascii():
+                    best, how = 1 + cost[i + 2]["C"], (2, "C", [int(data[i:i + 2])])
+            else:
+                v = _c128_value(ch, s_)
+                if v is not None:
+                    best, how = 1 + cost[i + 1][s_], (1, s_, [v])
+                else:
+                    other = "B" if s_ == "A" else "A"
+                    v2 = _c128_value(ch, other)
+                    if v2 is not None and 2 + cost[i + 1][s_] < best:
+                        best, how = 2 + cost[i + 1][s_], (1, s_, [C128_SHIFT, v2])
+            cost[i][s_], step[i][s_] = best, how
+        for s_ in sets:
+            for t in sets:
+                if t != s_ and step[i].get(t) and 1 + cost[i][t] < cost[i][s_]:
+                    cost[i][s_] = 1 + cost[i][t]
+                    step[i][s_] = (0, t, [C128_SWITCH[t]])
+    start = min(sets, key=lambda s_: (cost[0][s_], s_ != "C"))
+    if cost[0][start] == INF:
+        raise ValueError(f"Code128 ile kodlanamayan karakter: {data!r}")
+    values = [C128_START[start]]
+    i, cur = 0, start
+    while i < n:
+        adv, nxt, words = step[i][cur]
+        values += words
+        i, cur = i + adv, nxt
+    check = (values[0] + sum(k * v for k, v in enumerate(values[1:], 1))) % 103
+    return values + [check, C128_STOP]
+
+
+def code128_modules(values: List[int], quiet: int = 10) -> List[int]:
+    # Sözcükler -> modül bitleri (1 = çubuk), iki yanda quiet modül boşluk
+    bits = [0] * quiet
+    for v in values:
+        for k, w in enumerate(CODE128_PATTERNS[v]):
+            bits += [1 - (k & 1)] * int(w)
+    return bits + [0] * quiet
+
+
+def build_code128(barcode_value: str, width_px: int, height_px: int, module_width: float,
+                  dot_per_mm: int = 8, gs1: bool = False) -> Image.Image:
+    """
+    Barkodu doğrudan "1" modlu raster olarak üretir. Modül genişliği tam sayı nokta:
+    module_width (mm) yuvarlanır, width_px'e sığmıyorsa sığan en büyük değere düşürülür.
+    1 nokta/modülde de sığmıyorsa ValueError: kırpılmış sembol (quiet zone/kontrol/STOP eksik) okunamaz.
+    """
+    img = Image.new("1", (width_px, height_px), 1)
     if not barcode_value:
-        return Image.new("RGB", (width_px, height_px), "white")
-    if HAVE_PYTHON_BARCODE:
-        try:
-            code = Code128(barcode_value, writer=ImageWriter())
-        except TypeError:
-            code = Code128(barcode_value, writer=ImageWriter())
-        writer_options = {
-            "module_width": module_width,
-            "module_height": height_px,
-            "quiet_zone": 1,
-            "font_size": 0,
-            "text_distance": 1,
-            "background": "white",
-            "foreground": "black",
-            "write_text": False
-        }
-        img = code.render(writer_options)
-        if img.width != width_px or img.height != height_px:
-            img = img.resize((width_px, height_px), Image.NEAREST)
-        return img.convert("RGB")
-    # Fallback pseudo
-    img = Image.new("RGB", (width_px, height_px), "white")
-    d = ImageDraw.Draw(img)
-    x = 0
-    for ch in barcode_value:
-        w = (ord(ch) & 0x7) + 2
-        if x + w >= width_px:
-            break
-        d.rectangle([x, 0, x + w - 1, height_px], fill="black")
-        x += w + 2
-    return img
+        return img
+    data = gs1_to_code128_data(barcode_value) if gs1 else barcode_value
+    bits = code128_modules(code128_encode(data))
+    if len(bits) > width_px:
+        raise ValueError(f"Barkod sığmıyor: {len(bits)} modül (quiet zone dahil) > {width_px} nokta; "
+                         f"değeri kısaltın ya da etiket genişliğini artırın")
+    mod = max(1, int(round(module_width * dot_per_mm)))
+    mod = min(mod, width_px // len(bits))
+    row_bits = [b for b in bits for _ in range(mod)]
+    x0 = max(0, (width_px - len(row_bits)) // 2)
+    row = [0] * x0 + row_bits
+    row += [0] * (width_px - len(row))
+    # Tek satır paketlenir, yükseklik kadar tekrarlanır (1 = siyah, "1;I" ham modu)
+    w_bytes = (width_px + 7) // 8
+    packed = bytearray(w_bytes)
+    for x, b in enumerate(row):
+        if b:
+            packed[x >> 3] |= 0x80 >> (x & 7)
+    return Image.frombytes("1", (width_px, height_px), bytes(packed) * height_px, "raw", "1;I")
 
 
 # ===================== METİN SARMA =====================
@@ -333,7 +627,9 @@ def build_label_bitmap(data: LabelData, cfg: Config) -> Image.Image:
         data.barcode_value,
         max_text_width,
         barcode_h_mm * dot_per_mm,
-        cfg.barcode_module_width
+        cfg.barcode_module_width,
+        dot_per_mm=dot_per_mm,
+        gs1=cfg.barcode_gs1
     )
     img.paste(barcode_img, (x_text, y))
     y += barcode_img.height + int(dot_per_mm * 0.8)
@@ -369,7 +665,8 @@ def build_label_bitmap(data: LabelData, cfg: Config) -> Image.Image:
 def parse_args():
     ap = argparse.ArgumentParser(description="GS v0 Label Printer (temiz versiyon)")
     ap.add_argument("--port", default="/dev/ttyACM0")
-    ap.add_argument("--baudrate", type=int, default=19200)
+    ap.add_argument("--baudrate", type=int, default=None,
+                    help="Verilmezse printer_baud.json'daki kayıtlı hız, o da yoksa 19200.")
     ap.add_argument("--dot-per-mm", type=int, default=8)
     ap.add_argument("--head-width-mm", type=int, default=70)
     ap.add_argument("--content-width", type=int, default=50)
@@ -393,10 +690,14 @@ def parse_args():
     ap.add_argument("--allergy", default="ALERJEN: BAHARAT KAYNAKLI İZ PROTEİN İÇEREBİLİR.")
     ap.add_argument("--left-mm", type=float, default=None, help="İçerik alanını soldan mm cinsinden sabitle (ortalama yerine).")
     ap.add_argument("--font-scale", type=float, default=1.0)
-    ap.add_argument("--barcode-module-width", type=float, default=0.25)
+    ap.add_argument("--barcode-module-width", type=float, default=0.25, help="Modül genişliği (mm).")
+    ap.add_argument("--gs1", action="store_true", help="Barkod değerini GS1-128 AI'ları olarak kodla: (01)...(10)...")
     ap.add_argument("--debug", action="store_true")
     ap.add_argument("--black-test", action="store_true", help="Etiket yerine sadece siyah test bloğu gönder.")
     ap.add_argument("--handshake-delay", type=float, default=0.05)
+    ap.add_argument("--skip-blank", action="store_true", help="Boş satırları ESC J ile geç, beyaz sütunları kırp.")
+    ap.add_argument("--stream-bands", type=int, default=0, metavar="ROWS",
+                    help="Bitmap'i ROWS satırlık bantlar halinde paketle ve paketlerken gönder (0: kapalı).")
     ap.add_argument("--threshold-low", action="store_true", help="Daha koyu baskı için threshold otomatik 170'e indir.")
     return ap.parse_args()
 
@@ -409,7 +710,7 @@ def main():
 
     cfg = Config(
         port=args.port,
-        baudrate=args.baudrate,
+        baudrate=args.baudrate or load_saved_printer_baud(args.port) or Config.baudrate,
         dot_per_mm=args.dot_per_mm,
         head_width_mm=args.head_width_mm,
         content_box_mm=(args.content_width, args.content_height),
@@ -424,7 +725,10 @@ def main():
         font_scale=args.font_scale,
         left_content_mm=args.left_mm,
         barcode_module_width=args.barcode_module_width,
-        handshake_delay=args.handshake_delay
+        barcode_gs1=args.gs1,
+        handshake_delay=args.handshake_delay,
+        skip_blank=args.skip_blank,
+        stream_band_rows=max(0, args.stream_bands)
     )
 
     data = LabelData(
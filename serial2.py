@@ -13,8 +13,10 @@ import glob
 import json
 import time
 import math
+import functools
 import requests
 import serial
+from serial.tools import list_ports
 
 from typing import Tuple, Dict, Any, List, Optional
 from collections import deque
@@ -40,7 +42,8 @@ PREVIEW_BMP1_PATH = "label_preview_1b.bmp"
 PREVIEW_BIN_PATH  = "label_raster_padded.bin"
 
 PRN_PORT_FALLBACK = "/dev/ttyACM0"
-PRN_BAUD = 19200
+PRN_BAUD = 19200  # güvenli varsayılan; serial3'ün müzakere edip kaydettiği hız varsa o kullanılır
+PRN_BAUD_CACHE_PATH = os.getenv("PRN_BAUD_CACHE", "printer_baud.json")
 PRN_PARITY = serial.PARITY_NONE
 PRN_TIMEOUT = 0.5
 
@@ -58,6 +61,12 @@ ROTATE_180 = True
 THRESHOLD = 192
 INVERT_BW = False
 
+# Çizim doğrudan "L" (gri) ya da "1" tuvaline yapılır; eşik pack_1bit içinde tek geçişte uygulanır.
+# "RGB" yalnızca PNG önizleme içindir. "1" modunda metin kenar yumuşatmasız çizilir.
+RENDER_MODE = os.getenv("LABEL_RENDER_MODE", "L")
+INK = "black"
+PAPER = "white"
+
 # Yerleşim
 TITLE_Y = 60
 LEFT_BLOCK_Y = 150
@@ -76,6 +85,9 @@ DEFAULT_FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
 SCL_BAUD = 19200
 SCL_PARITY = serial.PARITY_ODD
 SCL_TIMEOUT = 0.5
+# XOFF/çerçeve/XON arasında flush ile beklenir; terazi ayrıca boşluk isterse saniye cinsinden
+AD2K_GAP_SEC = float(os.getenv("AD2K_GAP_SEC", "0"))
+AD2K_VERIFY_BCC = os.getenv("AD2K_VERIFY_BCC", "1") in ("1", "true", "True")
 
 # =========================
 # Yardımcılar (Genel)
@@ -107,6 +119,37 @@ def auto_serial_port_yazici() -> str:
     print("Yazıcı port fallback:", PRN_PORT_FALLBACK)
     return PRN_PORT_FALLBACK
 
+def printer_device_key(port: str) -> str:
+    # serial3 ile aynı anahtar: mümkünse VID:PID:seri no, değilse port yolu
+    try:
+        for p in list_ports.comports():
+            if p.device == port and p.vid is not None:
+                return f"{p.vid:04x}:{p.pid:04x}:{p.serial_number or port}"
+    except Exception:
+        pass
+    return port
+
+def load_saved_printer_baud(port: str) -> Optional[int]:
+    try:
+        with open(PRN_BAUD_CACHE_PATH, "r", encoding="utf-8") as f:
+            v = json.load(f).get(printer_device_key(port))
+        return int(v) if v else None
+    except Exception:
+        return None
+
+def printer_answers(ser: serial.Serial, attempts: int = 3) -> bool:
+    # DLE EOT 1: geçerli durum baytı (0xx1xx10) geri geliyorsa bu hızda iki yönlü iletişim doğrudur
+    for _ in range(attempts):
+        try:
+            ser.reset_input_buffer()
+            ser.write(b"\x10\x04\x01"); ser.flush()
+            resp = ser.read(1)
+        except Exception:
+            return False
+        if len(resp) == 1 and (resp[0] & 0x93) == 0x12:
+            return True
+    return False
+
 def fetch_job() -> Dict[str, Any]:
     try:
         resp = requests.get(GET_JOB_URL, timeout=4)
@@ -184,6 +227,7 @@ WIDTH_DOTS = round_to_8(REQ_W)   # 752
 HEIGHT_DOTS = REQ_H
 LABEL_WIDTH_BYTES = WIDTH_DOTS // 8  # 94
 
+@functools.lru_cache(maxsize=64)
 def load_font(font_path: str | None, size: int) -> ImageFont.ImageFont:
     if font_path:
         try:
@@ -231,8 +275,8 @@ def draw_ean13(canvas: Image.Image, x: int, y: int, width: int, height: int, dat
     draw = ImageDraw.Draw(canvas)
     digits = "".join(ch for ch in data if ch.isdigit())
     if len(digits) not in (12, 13):
-        draw.rectangle([x, y, x+width, y+height], outline=(0,0,0), width=2)
-        draw.text((x+4, y+height- font.size - 2), digits or "EAN13?", font=font, fill=(0,0,0))
+        draw.rectangle([x, y, x+width, y+height], outline=INK, width=2)
+        draw.text((x+4, y+height- font.size - 2), digits or "EAN13?", font=font, fill=INK)
         return
     if len(digits) == 12:
         digits += ean13_check_digit(digits)
@@ -259,16 +303,16 @@ def draw_ean13(canvas: Image.Image, x: int, y: int, width: int, height: int, dat
     for i, bit in enumerate(pattern):
         if bit == '1':
             x1 = x0 + i * mw
-            draw.rectangle([x1, y, x1 + mw - 1, y + bar_h], fill=(0,0,0))
+            draw.rectangle([x1, y, x1 + mw - 1, y + bar_h], fill=INK)
 
     num_text = f"{first} {left} {right}"
     tw = int(draw.textlength(num_text, font=font))
-    draw.text((x0 + (bw - tw)//2, y + bar_h + 2), num_text, font=font, fill=(0,0,0))
+    draw.text((x0 + (bw - tw)//2, y + bar_h + 2), num_text, font=font, fill=INK)
 
 # Görsel oluşturma – barkod sağda, bilgiler solda
-def compose_label(data: Dict[str, Any], width_dots: int, height_dots: int, forbid_bottom_px: int) -> Image.Image:
+def compose_label(data: Dict[str, Any], width_dots: int, height_dots: int, forbid_bottom_px: int, mode: str = RENDER_MODE) -> Image.Image:
     font_path = data.get("font_path") or DEFAULT_FONT_PATH
-    canvas = Image.new("RGB", (width_dots, height_dots), (255, 255, 255))
+    canvas = Image.new(mode, (width_dots, height_dots), PAPER)
     draw = ImageDraw.Draw(canvas)
 
     f_title = load_font(font_path, 44)
@@ -280,23 +324,23 @@ def compose_label(data: Dict[str, Any], width_dots: int, height_dots: int, forbi
     product = str(data.get("product_name", "")).strip()
     if product:
         tw = draw.textlength(product, font=f_title)
-        draw.text(((width_dots - tw)//2, TITLE_Y), product, font=f_title, fill=(0,0,0))
+        draw.text(((width_dots - tw)//2, TITLE_Y), product, font=f_title, fill=INK)
 
     y0 = LEFT_BLOCK_Y
     left_x = LEFT_MARGIN
     label_w = 120
     val_x = left_x + label_w + 8
 
-    draw.text((left_x, y0), "Adet:", font=f_label, fill=(0,0,0))
-    draw.text((val_x,  y0), str(data.get("count", "")), font=f_label, fill=(0,0,0))
+    draw.text((left_x, y0), "Adet:", font=f_label, fill=INK)
+    draw.text((val_x,  y0), str(data.get("count", "")), font=f_label, fill=INK)
 
     y1 = y0 + LEFT_BLOCK_GAP
-    draw.text((left_x, y1), "Ağırlık:", font=f_label, fill=(0,0,0))
-    draw.text((val_x,  y1), str(data.get("weight_str", "")), font=f_sub, fill=(0,0,0))
+    draw.text((left_x, y1), "Ağırlık:", font=f_label, fill=INK)
+    draw.text((val_x,  y1), str(data.get("weight_str", "")), font=f_sub, fill=INK)
 
     y2 = y1 + LEFT_BLOCK_GAP
-    draw.text((left_x, y2), "S.T.T.:", font=f_label, fill=(0,0,0))
-    draw.text((val_x,  y2), str(data.get("expiry", "")), font=f_label, fill=(0,0,0))
+    draw.text((left_x, y2), "S.T.T.:", font=f_label, fill=INK)
+    draw.text((val_x,  y2), str(data.get("expiry", "")), font=f_label, fill=INK)
 
     right_x = LEFT_MARGIN + LEFT_COL_WIDTH + COL_GAP
     right_w = max(200, width_dots - right_x - LEFT_MARGIN)
@@ -325,35 +369,53 @@ def compose_label(data: Dict[str, Any], width_dots: int, height_dots: int, forbi
         max_lines = max(1, block_h // line_h)
         if len(lines) > max_lines:
             lines = lines[:max_lines-1] + ["..."]
-        draw.multiline_text((LEFT_MARGIN, text_top), "\n".join(lines), font=f_text, fill=(0,0,0), spacing=6)
+        draw.multiline_text((LEFT_MARGIN, text_top), "\n".join(lines), font=f_text, fill=INK, spacing=6)
 
     if ROTATE_180:
         canvas = canvas.rotate(180, expand=False)
     return canvas
 
 # Raster dönüşüm
-def to_1bit_bytes(img: Image.Image, width_dots: int, threshold: int = THRESHOLD, invert: bool = INVERT_BW) -> Tuple[bytes, int, int]:
-    w, h = img.size
-    assert w == width_dots, f"Image width {w} != {width_dots}"
-    bw = img.convert("L").point(lambda p: 0 if p < threshold else 255, "L")
-    width_bytes = width_dots // 8
+# 1-bit paketleme motoru: eşikleme + ters çevirme + MSB-first paketleme tek C geçişinde.
+# Çıktı bayt bayt eski piksel döngüsüyle aynıdır (1 = siyah nokta, satır sonu 0 ile dolar).
+def _threshold_lut(threshold: int, invert: bool) -> List[int]:
+    # "1" modunda 255 -> bit 1; yazıcıda bit 1 siyah nokta demek
+    return [255 if ((p < threshold) ^ invert) else 0 for p in range(256)]
+
+def _pack_1bit_py(gray: Image.Image, threshold: int, invert: bool) -> bytes:
+    # Yedek yol (Pillow "L"->"1" point desteklemezse): saf Python, satır satır
+    w, h = gray.size
+    width_bytes = (w + 7) // 8
     raw = bytearray(width_bytes * h)
-    p = bw.load()
+    px = gray.tobytes()
     for y in range(h):
+        row = px[y * w:(y + 1) * w]
         off = y * width_bytes
-        val = 0
-        bitc = 0
-        xb = 0
-        for x in range(width_dots):
-            bit = 1 if ((p[x, y] == 0) ^ invert) else 0
-            val = ((val << 1) | bit) & 0xFF
-            bitc += 1
-            if bitc == 8:
-                raw[off + xb] = val
-                val = 0
-                bitc = 0
-                xb += 1
-    return bytes(raw), width_bytes, h
+        for xb in range(width_bytes):
+            group = row[xb * 8:xb * 8 + 8]
+            val = 0
+            for p in group:
+                val = (val << 1) | (1 if ((p < threshold) ^ invert) else 0)
+            raw[off + xb] = val << (8 - len(group))
+    return bytes(raw)
+
+_BYTE_INVERT = bytes(255 - i for i in range(256))
+
+def pack_1bit(img: Image.Image, threshold: int = THRESHOLD, invert: bool = INVERT_BW) -> bytes:
+    if img.mode == "1" and img.width % 8 == 0:
+        # "1" tuvali zaten eşiklenmiş: Pillow'da bit 1 beyaz, yazıcıda siyah -> bayt tablosuyla çevir
+        data = img.tobytes()
+        return data if invert else data.translate(_BYTE_INVERT)
+    gray = img if img.mode == "L" else img.convert("L")
+    try:
+        return gray.point(_threshold_lut(threshold, invert), "1").tobytes()
+    except Exception:
+        return _pack_1bit_py(gray, threshold, invert)
+
+def to_1bit_bytes(img: Image.Image, width_dots: int, threshold: int = THRESHOLD, invert: bool = INVERT_BW) -> Tuple[bytes, int, int]:
+    w, h = img.size
+    assert w == width_dots, f"Image width {w} != {width_dots}"
+    return pack_1bit(img, threshold=threshold, invert=invert), width_dots // 8, h
 
 def pad_rows_to_device_width(raw: bytes, label_wb: int, device_wb: int, rows: int, align: str = "center") -> bytes:
     assert device_wb >= label_wb
@@ -442,32 +504,63 @@ def send_label_image_to_printer(ser_yazici: serial.Serial, payload: Dict[str, An
 # Terazi / AD2K Fonksiyonları
 # =========================
 
-def make_ad2k_frame(command_bytes):
-    frame = b'\x02' + command_bytes + b'\x03'
+AD2K_ACK, AD2K_NAK = 0x06, 0x15
+
+def _ad2k_gap(ser):
+    ser.flush()
+    if AD2K_GAP_SEC > 0:
+        time.sleep(AD2K_GAP_SEC)
+
+def ad2k_bcc(frame) -> int:
     bcc = 0
     for b in frame:
         bcc ^= b
-    return frame + bytes([bcc])
+    return bcc
 
-def send_ad2k_command(ser, command_bytes, response_timeout=1.0):
+def make_ad2k_frame(command_bytes):
+    frame = b'\x02' + command_bytes + b'\x03'
+    return frame + bytes([ad2k_bcc(frame)])
+
+def ad2k_response_complete(resp, expect_frame: bool = False) -> bool:
+    """
+    Yanıt tamam mı: BCC'si tutan bir STX...ETX+BCC çerçevesi ya da (çerçevesiz terazilerde) LF ile
+    biten bir satır. Tek başına ACK/NAK yalnız veri beklemeyen komutlarda (T, Z) tamam sayılır;
+    expect_frame (RN) ise ACK'ten sonra gelecek çerçeve beklenir.
+    """
+    if not resp:
+        return False
+    if len(resp) == 1 and resp[0] in (AD2K_ACK, AD2K_NAK):
+        return not expect_frame
+    stx = resp.find(b"\x02")
+    if stx < 0:
+        return resp.endswith(b"\n")
+    while stx >= 0:
+        etx = resp.find(b"\x03", stx + 1)
+        if etx < 0 or etx + 1 >= len(resp):
+            return False
+        if not AD2K_VERIFY_BCC or resp[etx + 1] == ad2k_bcc(resp[stx:etx + 1]):
+            return True
+        stx = resp.find(b"\x02", etx + 2)  # bozuk çerçeve; varsa sonrakine bak
+    return False
+
+def send_ad2k_command(ser, command_bytes, response_timeout=1.0, expect_frame=False):
+    # Yanıt geldikçe okunur; çerçeve tamamlanınca (ETX + doğru BCC) beklemeden dönülür
     ser.reset_input_buffer()
     ser.write(b'\x13')  # Xoff
-    time.sleep(0.02)
-    frame = make_ad2k_frame(command_bytes)
-    ser.write(frame)
-    time.sleep(0.02)
+    _ad2k_gap(ser)
+    ser.write(make_ad2k_frame(command_bytes))
+    _ad2k_gap(ser)
     ser.write(b'\x11')  # Xon
     ser.flush()
-    time.sleep(response_timeout)
-    resp = b""
-    start = time.time()
-    while time.time() - start < response_timeout:
+    resp = bytearray()
+    deadline = time.monotonic() + response_timeout
+    while time.monotonic() < deadline:
         part = ser.read(ser.in_waiting or 1)
         if part:
             resp += part
-        else:
-            time.sleep(0.01)
-    return resp
+            if ad2k_response_complete(resp, expect_frame):
+                break
+    return bytes(resp)
 
 def send_terazi_handshake_ad2k_commands(ser):
     commands = [
@@ -489,10 +582,12 @@ def send_terazi_handshake_ad2k_commands(ser):
         time.sleep(0.1)
     print("Terazi handshake (AD2K) tamamlandı.")
 
+WEIGHT_LEGACY_RE = re.compile(r'\b0000(\d),(\d{3})')
+
 def parse_weight_line(line):
     if isinstance(line, bytes):
         line = line.decode(errors="ignore")
-    match = re.search(r'\b0000(\d),(\d{3})', line)
+    match = WEIGHT_LEGACY_RE.search(line)
     if match:
         kg = int(match.group(1))
         gr = int(match.group(2))
@@ -530,10 +625,15 @@ def main():
         )
         send_terazi_handshake_ad2k_commands(ser_terazi)
 
+    saved_baud = load_saved_printer_baud(prn_port)
     ser_yazici = serial.Serial(
-        port=prn_port, baudrate=PRN_BAUD, bytesize=serial.EIGHTBITS,
+        port=prn_port, baudrate=saved_baud or PRN_BAUD, bytesize=serial.EIGHTBITS,
         parity=PRN_PARITY, stopbits=serial.STOPBITS_ONE, timeout=PRN_TIMEOUT,
     )
+    # Kayıtlı hız eski olabilir (yazıcı sıfırlandı / değiştirildi): durum yanıtı yoksa güvenli varsayılana dön
+    if saved_baud and saved_baud != PRN_BAUD and not printer_answers(ser_yazici):
+        print(f"Yazıcı kayıtlı hızda ({saved_baud}) yanıt vermedi; {PRN_BAUD} ile devam ediliyor.")
+        ser_yazici.baudrate = PRN_BAUD
     printer_handshake(ser_yazici)
 
     print("Hazır. Komut bekleniyor...")
@@ -632,7 +732,7 @@ def main():
 
         # 2) Tartı okuma ve baskı (start/done akışı)
         if sending_data and mrp_id and ser_terazi:
-            resp = send_ad2k_command(ser_terazi, b'RN\x1C')
+            resp = send_ad2k_command(ser_terazi, b'RN\x1C', expect_frame=True)
             buffer += resp
             while b"\r" in buffer:
                 line, buffer = buffer.split(b"\r", 1)
@@ -15,13 +15,16 @@ import time
 import math
 import threading
 import queue
-from collections import deque
+import weakref
+import functools
+import hashlib
+from collections import deque, OrderedDict
 from typing import Tuple, Dict, Any, List, Optional
 
 import requests
 import serial
 from serial.tools import list_ports
-from PIL import Image, ImageDraw, ImageFont, ImageTk
+from PIL import Image, ImageDraw, ImageFont, ImageTk, ImageChops
 import tkinter as tk
 from tkinter import ttk, messagebox
 
@@ -30,18 +33,65 @@ GET_JOB_URL = "https://altinayet-stage-22335048.dev.odoo.com/terazi/get_scale_jo
 ODOO_URL_TEMPLATE = "https://altinayet-stage-22335048.dev.odoo.com/terazi/get/{mrp_id}/{weight}"
 STABLE_COUNT = 5
 SENSITIVITY_GRAM = 20
+# Kararlılık penceresi ayrıca zamanla da tanımlanabilir (ms): son STABLE_WINDOW_MS içindeki okumalar
+# tolerans içindeyse ve en az STABLE_COUNT okuma varsa kararlı. 0 = yalnız son STABLE_COUNT okuma (eski davranış).
+STABLE_WINDOW_MS = int(os.getenv("STABLE_WINDOW_MS", "0"))
+# Aykırı okuma süzgeci: "none", "median3" (son üç okumanın medyanı) ya da "spike" (öncekinden STABLE_SPIKE_GRAMS'tan
+# fazla sıçrayan okuma, bir sonraki okuma doğrulamazsa atılır)
+STABLE_FILTER = os.getenv("STABLE_FILTER", "none").strip().lower()
+STABLE_SPIKE_GRAMS = int(os.getenv("STABLE_SPIKE_GRAMS", "1000"))
 MAX_REALISTIC_GRAMS = 25000
+# Yerel tartım barkodu: ürün bilgisi mrp_id başına Odoo'dan bir kez alınır; her tartımda ağırlık gömülü
+# EAN-13 (önek + ürün kodu + gram + kontrol) ve weight_str burada üretilir, baskı yolunda ağ çağrısı olmaz.
+LOCAL_WEIGHT_BARCODE = os.getenv("LOCAL_WEIGHT_BARCODE", "0") in ("1", "true", "True")
+WEIGHT_BARCODE_PREFIX = os.getenv("WEIGHT_BARCODE_PREFIX", "28")  # 20-29 değişken ölçülü ürün aralığı
+WEIGHT_BARCODE_ITEM_DIGITS = 5   # önek(2) + ürün(5) + ağırlık(5) + kontrol(1) = 13
+WEIGHT_STR_FORMAT = os.getenv("WEIGHT_STR_FORMAT", "{kg:.3f} KG")
 
 # -------- Yazıcı --------
 IS_WINDOWS = os.name == "nt"
 PRN_PORT_FALLBACK = "COM3" if IS_WINDOWS else "/dev/ttyACM0"
-PRN_BAUD = 19200
+PRN_BAUD = 19200  # güvenli varsayılan; müzakere edilen hız aşağıdaki dosyadan okunur
+# Açılışta daha yüksek hızları dene (yazıcının arayüz ayarını değiştirir, bu yüzden isteğe bağlı)
+PRN_BAUD_PROBE = os.getenv("PRN_BAUD_PROBE", "0") in ("1", "true", "True")
+PRN_BAUD_CANDIDATES = tuple(int(b) for b in os.getenv("PRN_BAUD_CANDIDATES", "115200,57600,38400").split(",") if b.strip())
+PRN_BAUD_CACHE_PATH = os.getenv("PRN_BAUD_CACHE", "printer_baud.json")
 PRN_PARITY = serial.PARITY_NONE
 PRN_TIMEOUT = 0.5
+# Akış kontrolü: "rtscts" (donanım), "xonxoff" (yazılım), "usb" (USB CDC; geri basınç bağlantının kendisinde)
+# ya da "none". Akış kontrolü varken raster parçaları ara flush/bekleme olmadan art arda yazılır.
+PRN_FLOW = os.getenv("PRN_FLOW", "none").strip().lower()
+PRN_WRITE_TIMEOUT = float(os.getenv("PRN_WRITE_TIMEOUT", "10"))  # yazıcı CTS/XOFF ile bu kadar tutarsa hata
+# Gerçek zamanlı durum sorgusu (DLE EOT): tek baytlık yanıt için bekleme ve hazır olmayı bekleme üst sınırı
+PRN_STATUS_TIMEOUT = float(os.getenv("PRN_STATUS_TIMEOUT", "0.1"))
+PRN_READY_TIMEOUT = float(os.getenv("PRN_READY_TIMEOUT", "5"))
+# Baskı bitişi (GS ( H işlem kimliği yanıtı): önceki veriler basılınca gelir; gelmezse bu süre sonunda hata
+PRN_JOB_TIMEOUT = float(os.getenv("PRN_JOB_TIMEOUT", "15"))
 DEVICE_WIDTH_BYTES = 108
 DEVICE_WIDTH_DOTS  = DEVICE_WIDTH_BYTES * 8
 DATA_CHUNK_SIZE = 4096
 FEED_AFTER_LINES = 0
+# Boş (beyaz) raster satırları veri yerine ESC J (n nokta kağıt besleme) ile geçilir.
+# ESC V yalnız yükseklik aldığından sütun kırpma bu yolda yapılamaz; satır atlama yapılır.
+SKIP_BLANK_ROWS = os.getenv("SKIP_BLANK_ROWS", "0") in ("1", "true", "True")
+BLANK_RUN_MIN_ROWS = int(os.getenv("BLANK_RUN_MIN_ROWS", "8"))  # daha kısa boş koşular banda dahil edilir
+# Akış modu: raster sabit yükseklikte bantlar halinde paketlenir ve paketleme ile gönderim üst üste biner
+STREAM_BANDS = os.getenv("STREAM_BANDS", "0") in ("1", "true", "True")
+STREAM_BAND_ROWS = int(os.getenv("STREAM_BAND_ROWS", "64"))
+# Hibrit çıktı: EAN-13 çubukları yazıcının kendi barkod komutuyla (GS k), geri kalan yalnız mürekkepli
+# bantlar sayfa modunda (ESC L) konumlarında grafik olarak basılır (her bant GS ( L fn 112 ile saklanıp
+# fn 50 ile basılır). Yazıcı sayfa modunu ve grafik tamponunu desteklemeli.
+HYBRID_NATIVE_BARCODE = os.getenv("HYBRID_NATIVE_BARCODE", "0") in ("1", "true", "True")
+# Seri baskıda bitmap yazıcı belleğine bir kez indirilir (GS 8 L / GS ( L indirme grafiği),
+# kopyalar anahtarla basılır. Yazıcı bu komutları desteklemiyorsa her kopya yeniden gönderilir.
+COPIES_BY_REFERENCE = os.getenv("COPIES_BY_REFERENCE", "0") in ("1", "true", "True")
+DOWNLOAD_GRAPHICS_KEY = b"LB"
+# Aynı içerikli etiketlerin hazır cihaz raster'ı bellekte tutulur (bayt bütçeli LRU); 0 kapatır
+RASTER_CACHE_BYTES = int(os.getenv("RASTER_CACHE_BYTES", str(8 * 1024 * 1024)))
+# İki katmanlı çizim: ürün başına statik katman (başlık, içindekiler, notlar) paketli raster olarak tutulur,
+# her tartımda yalnız değişken alanların bandı çizilip üzerine bindirilir; 0 kapatır
+TEMPLATE_CACHE_BYTES = int(os.getenv("TEMPLATE_CACHE_BYTES", str(4 * 1024 * 1024)))
+VARIABLE_FIELDS = ("weight_str", "expiry", "barcode")
 
 PREVIEW_PNG_PATH = "label_preview.png"
 PREVIEW_BMP1_PATH = "label_preview_1b.bmp"
@@ -55,6 +105,12 @@ ROTATE_180 = True
 THRESHOLD = 192
 INVERT_BW = False
 
+# Çizim doğrudan "L" (gri) ya da "1" tuvaline yapılır; eşik pack_1bit içinde tek geçişte uygulanır.
+# "RGB" yalnızca PNG önizleme içindir. "1" modunda metin kenar yumuşatmasız çizilir.
+RENDER_MODE = os.getenv("LABEL_RENDER_MODE", "L")
+INK = "black"
+PAPER = "white"
+
 def round_to_8(n: int) -> int:
     return int(math.ceil(n / 8.0) * 8)
 
@@ -93,6 +149,11 @@ PRODUCT_TITLE_TOP_SAFE_MM = float(os.getenv("PRODUCT_TITLE_TOP_SAFE_MM", "3.0"))
 PRODUCT_TITLE_GAP_PX = mm_to_dots(PRODUCT_TITLE_GAP_MM)
 PRODUCT_TITLE_TOP_SAFE_PX = mm_to_dots(PRODUCT_TITLE_TOP_SAFE_MM)
 
+# Uzun ürün adları küçültülmeden önce iki satıra bölünebilir (kapalıysa tek satır küçültme)
+PRODUCT_TITLE_WRAP = os.getenv("PRODUCT_TITLE_WRAP", "0") in ("1", "true", "True")
+PRODUCT_TITLE_MIN_SIZE = 22
+PRODUCT_TITLE_LINE_GAP_PX = 2
+
 # İç blok metin başlangıcında ekstra boşluk (alt metin üstünde)
 TEXT_TOP_EXTRA_PX = int(os.getenv("TEXT_TOP_EXTRA_PX", "10"))  # 16 -> 10
 
@@ -114,17 +175,65 @@ def _scan_font_dirs() -> list[str]:
         pass
     return [d for d in dict.fromkeys(dirs) if os.path.isdir(d)]
 
-def _find_font_by_names(names: list[str]) -> Optional[str]:
-    for d in _scan_font_dirs():
+# Font dizinlerinin listesi diskte önbelleklenir; her dizinin mtime'ı kaydedilir. Sıcak başlangıçta
+# os.walk yerine yalnız kayıtlı dizinler stat edilir; biri değiştiyse indeks yeniden kurulur.
+FONT_INDEX_PATH = os.getenv(
+    "FONT_INDEX_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "label_font_index.json")
+)
+FONT_INDEX_VERSION = 1
+
+def _build_font_index(dirs: list[str]) -> Dict[str, Any]:
+    # os.walk sırası korunur: arama sonucu indekssiz taramayla aynı olur
+    roots: list = []
+    mtimes: Dict[str, float] = {}
+    for d in dirs:
         try:
             for root, _, files in os.walk(d):
-                lower = {f.lower(): f for f in files}
-                for name in names:
-                    key = name.lower()
-                    if key in lower:
-                        return os.path.join(root, lower[key])
+                try:
+                    mtimes[root] = os.stat(root).st_mtime
+                except OSError:
+                    continue
+                roots.append([root, files])
         except Exception:
             continue
+    return {"version": FONT_INDEX_VERSION, "dirs": dirs, "mtimes": mtimes, "roots": roots}
+
+def _font_index_valid(index: Dict[str, Any], dirs: list[str]) -> bool:
+    if index.get("version") != FONT_INDEX_VERSION or index.get("dirs") != dirs:
+        return False
+    try:
+        return all(os.stat(root).st_mtime == m for root, m in index["mtimes"].items())
+    except OSError:
+        return False
+
+@functools.lru_cache(maxsize=1)
+def load_font_index() -> Dict[str, Any]:
+    dirs = _scan_font_dirs()
+    try:
+        with open(FONT_INDEX_PATH, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if _font_index_valid(index, dirs):
+            return index
+    except Exception:
+        pass
+    index = _build_font_index(dirs)
+    try:
+        os.makedirs(os.path.dirname(FONT_INDEX_PATH) or ".", exist_ok=True)
+        tmp = FONT_INDEX_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp, FONT_INDEX_PATH)
+    except Exception:
+        pass
+    return index
+
+def _find_font_by_names(names: list[str]) -> Optional[str]:
+    for root, files in load_font_index()["roots"]:
+        lower = {f.lower(): f for f in files}
+        for name in names:
+            key = name.lower()
+            if key in lower:
+                return os.path.join(root, lower[key])
     return None
 
 def resolve_sans_serif_paths() -> tuple[Optional[str], Optional[str]]:
@@ -141,20 +250,30 @@ def resolve_sans_serif_paths() -> tuple[Optional[str], Optional[str]]:
     return _find_font_by_names(normal_candidates), _find_font_by_names(bold_candidates)
 
 FORCE_SANS_SERIF = os.getenv("FORCE_SANS_SERIF", "1") in ("1", "true", "True")
-SANS_NORMAL_PATH, SANS_BOLD_PATH = resolve_sans_serif_paths()
 
-def load_font_exact(path: Optional[str], size: int) -> ImageFont.ImageFont:
+@functools.lru_cache(maxsize=1)
+def sans_serif_paths() -> tuple[Optional[str], Optional[str]]:
+    # İçe aktarmada değil, ilk ihtiyaçta çözülür: (normal, bold)
+    return resolve_sans_serif_paths()
+
+# Süreç genelinde font önbelleği: (yol, boyut, indeks) -> FreeTypeFont. Tekrarlanan etiketlerde font dosyası açılmaz.
+FONT_CACHE_SIZE = int(os.getenv("FONT_CACHE_SIZE", "64"))
+
+@functools.lru_cache(maxsize=FONT_CACHE_SIZE)
+def _load_font_cached(path: Optional[str], size: int, index: int) -> ImageFont.ImageFont:
     if path and os.path.exists(path):
         try:
-            return ImageFont.truetype(path, size=size)
+            return ImageFont.truetype(path, size=size, index=index)
         except Exception:
             pass
     return ImageFont.load_default()
 
-def get_fonts_for_sizes(
-    size_title=34, size_sub=28, size_label=24, size_text=20, size_bar=18,  # text 18->20
-    payload_font_path: Optional[str] = None
-):
+def load_font_exact(path: Optional[str], size: int, index: int = 0) -> ImageFont.ImageFont:
+    return _load_font_cached(path, int(size), int(index))
+
+@functools.lru_cache(maxsize=32)
+def _resolve_font_pair(payload_font_path: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    # Payload fontu ve kalın varyantı diskte bir kez aranır
     normal_base = None
     bold_base = None
     if not FORCE_SANS_SERIF and payload_font_path and os.path.exists(payload_font_path):
@@ -166,10 +285,20 @@ def get_fonts_for_sizes(
             if os.path.exists(cand):
                 bold_base = cand
                 break
-    if not normal_base:
-        normal_base = SANS_NORMAL_PATH
-    if not bold_base:
-        bold_base = SANS_BOLD_PATH
+    sans_normal, sans_bold = sans_serif_paths()
+    return normal_base or sans_normal, bold_base or sans_bold
+
+def font_cache_info() -> Dict[str, int]:
+    fi = _load_font_cached.cache_info()
+    pi = _resolve_font_pair.cache_info()
+    return {"hits": fi.hits, "misses": fi.misses, "size": fi.currsize, "maxsize": fi.maxsize,
+            "path_hits": pi.hits, "path_misses": pi.misses}
+
+def get_fonts_for_sizes(
+    size_title=34, size_sub=28, size_label=24, size_text=20, size_bar=18,  # text 18->20
+    payload_font_path: Optional[str] = None
+):
+    normal_base, bold_base = _resolve_font_pair(payload_font_path)
     return {
         "title":   load_font_exact(normal_base, size_title),
         "title_b": load_font_exact(bold_base,   size_title),
@@ -189,15 +318,66 @@ SCL_BAUD = 19200
 SCL_PARITY = serial.PARITY_ODD
 SCL_TIMEOUT = 0.5
 SCL_PORT_FALLBACK = "COM6" if IS_WINDOWS else "/dev/ttyUSB0"
+# XOFF/çerçeve/XON arasında baytların hatta çıkması flush ile beklenir; terazi ayrıca boşluk isterse saniye cinsinden
+AD2K_GAP_SEC = float(os.getenv("AD2K_GAP_SEC", "0"))
+# Bağlanınca terazinin kendiliğinden (sürekli) veri gönderip göndermediği bu süre dinlenir; gönderiyorsa
+# PUSH (dinleme) moduna, göndermiyorsa POLL moduna geçilir.
+SCL_AUTO_DETECT = os.getenv("SCL_AUTO_DETECT", "1") in ("1", "true", "True")
+SCL_DETECT_SEC = float(os.getenv("SCL_DETECT_SEC", "0.8"))
+# Teraziyi sürekli çıkışa alan AD2K komut gövdesi (STX/ETX/BCC hariç, hex), ör. "57 43 31".
+# Komut terazi modeline/ayarına göre değişir; boşsa bu işlem sunulmaz.
+SCL_STREAM_COMMAND = os.getenv("SCL_STREAM_COMMAND", "")
+# Yanıt çerçevesinin BCC'si (STX..ETX XOR) doğrulanır; tutmayan çerçeve için zaman aşımına kadar okunur
+AD2K_VERIFY_BCC = os.getenv("AD2K_VERIFY_BCC", "1") in ("1", "true", "True")
+
+def _ad2k_gap(ser):
+    ser.flush()
+    if AD2K_GAP_SEC > 0:
+        time.sleep(AD2K_GAP_SEC)
 
-def make_ad2k_frame(command_bytes):
-    frame = b'\x02' + command_bytes + b'\x03'
+# Sonlandırıcısız veri bu sınırı aşarsa (terazi hiç CR/LF/ETX göndermiyorsa) bekleyen kısım atılır
+SCL_FRAME_MAX_BYTES = int(os.getenv("SCL_FRAME_MAX_BYTES", "4096"))
+
+AD2K_ACK, AD2K_NAK = 0x06, 0x15
+
+def ad2k_bcc(frame) -> int:
     bcc = 0
     for b in frame:
         bcc ^= b
-    return frame + bytes([bcc])
+    return bcc
 
-def send_ad2k_command(ser, command_bytes, response_timeout=0.6):
+def make_ad2k_frame(command_bytes):
+    frame = b'\x02' + command_bytes + b'\x03'
+    return frame + bytes([ad2k_bcc(frame)])
+
+def ad2k_response_complete(resp, expect_frame: bool = False) -> bool:
+    """
+    Yanıt tamam mı: BCC'si tutan bir STX...ETX+BCC çerçevesi ya da (çerçevesiz terazilerde) LF ile
+    biten bir satır. Tek başına ACK/NAK yalnız veri beklemeyen komutlarda (T, Z) tamam sayılır;
+    expect_frame (RN) ise ACK'ten sonra gelecek çerçeve beklenir.
+    """
+    if not resp:
+        return False
+    if len(resp) == 1 and resp[0] in (AD2K_ACK, AD2K_NAK):
+        return not expect_frame
+    stx = resp.find(b"\x02")
+    if stx < 0:
+        return resp.endswith(b"\n")
+    while stx >= 0:
+        etx = resp.find(b"\x03", stx + 1)
+        if etx < 0 or etx + 1 >= len(resp):
+            return False
+        if not AD2K_VERIFY_BCC or resp[etx + 1] == ad2k_bcc(resp[stx:etx + 1]):
+            return True
+        stx = resp.find(b"\x02", etx + 2)  # bozuk çerçeve; varsa sonrakine bak
+    return False
+
+def send_ad2k_command(ser, command_bytes, response_timeout=0.6, expect_frame=False):
+    """
+    XOFF / çerçeve / XON gönderir ve yanıtı geldikçe çözer; çerçeve tamamlanınca (ETX + doğru BCC)
+    hemen döner. response_timeout yalnız yanıt gelmezse ya da bozuksa beklenen üst sınırdır.
+    Veri döndüren komutlarda (RN) expect_frame=True verilir; önden gelen ACK yanıtı bitirmez.
+    """
     try:
         ser.reset_input_buffer()
     except Exception:
@@ -206,94 +386,250 @@ def send_ad2k_command(ser, command_bytes, response_timeout=0.6):
         ser.write(b'\x13')  # Xoff
     except Exception:
         return b""
-    time.sleep(0.02)
-    frame = make_ad2k_frame(command_bytes)
-    ser.write(frame)
-    time.sleep(0.02)
+    _ad2k_gap(ser)
+    ser.write(make_ad2k_frame(command_bytes))
+    _ad2k_gap(ser)
     ser.write(b'\x11')  # Xon
     ser.flush()
-    resp = b""
-    start = time.time()
-    while time.time() - start < response_timeout:
+    resp = bytearray()
+    deadline = time.monotonic() + response_timeout
+    while time.monotonic() < deadline:
         chunk = ser.read(ser.in_waiting or 1)
         if chunk:
             resp += chunk
-        else:
-            time.sleep(0.01)
-    return resp
+            if ad2k_response_complete(resp, expect_frame):
+                break
+    return bytes(resp)
+
+def read_scale_chunk(ser) -> bytes:
+    # Gelen ne varsa hemen döner; yoksa ilk bayt için en fazla ser.timeout bekler (sabit 128 bayt beklenmez)
+    return ser.read(ser.in_waiting or 1)
+
+def detect_scale_streaming(ser, window: float = SCL_DETECT_SEC, min_frames: int = 2) -> Optional[bool]:
+    """
+    Terazi komut beklemeden satır gönderiyor mu: window süresi boyunca dinlenir,
+    en az min_frames sonlandırılmış çerçeve gelirse True (sürekli çıkış), hiç bayt gelmezse False.
+    Bayt gelip yeterli çerçeve çıkmazsa (yavaş çıkış, gürültü, yarım satır) karar verilemez: None.
+    """
+    try:
+        ser.reset_input_buffer()
+    except Exception:
+        pass
+    splitter = FrameSplitter()
+    frames = 0
+    got_bytes = False
+    deadline = time.monotonic() + window
+    while time.monotonic() < deadline:
+        chunk = read_scale_chunk(ser)
+        if chunk:
+            got_bytes = True
+            frames += len(splitter.feed(chunk))
+            if frames >= min_frames:
+                return True
+    return None if got_bytes else False
+
+def enable_scale_streaming(ser, command_hex: str = SCL_STREAM_COMMAND) -> Optional[bool]:
+    # Yapılandırılmış komutla teraziyi sürekli çıkışa alır ve sonucu dinleyerek doğrular (detect_scale_streaming gibi)
+    if not command_hex.strip():
+        return False
+    send_ad2k_command(ser, bytes.fromhex(command_hex), response_timeout=0.6)
+    return detect_scale_streaming(ser)
+
+class FrameSplitter:
+    """
+    Teraziden gelen akışı çerçevelere böler: CR, LF, CRLF ve STX...ETX (AD2K yanıtı) karışık gelebilir.
+    ETX'ten sonraki bayt BCC'dir: çerçeve STX ile başladıysa doğrulanır (AD2K_VERIFY_BCC), her durumda
+    atılır, sonraki çerçeveye karışmaz. BCC henüz gelmediyse çerçeve bir sonraki feed()'e kadar bekler.
+    Veri tek bir bytearray'de birikir, okuma konumu ilerler; tüketilen baş kısım arada bir silinir.
+    Çerçeveler memoryview olarak verilir ve yalnız bir sonraki feed() çağrısına kadar geçerlidir.
+    """
+    DELIMS = re.compile(rb"[\r\n\x02\x03]")
+
+    def __init__(self, max_bytes: int = SCL_FRAME_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.buf = bytearray()
+        self.pos = 0
+        self.stats = {"frames": 0, "dropped_bytes": 0, "bcc_errors": 0}
+        self._views: List[memoryview] = []
+
+    def _release_views(self):
+        # Önceki çerçeveler bırakılmazsa bytearray büyütülemez (BufferError)
+        for v in self._views:
+            try:
+                v.release()
+            except BufferError:
+                pass
+        self._views = []
+
+    def feed(self, data: bytes) -> List[memoryview]:
+        self._release_views()
+        buf = self.buf
+        if self.pos and self.pos * 2 >= len(buf):
+            try:
+                del buf[:self.pos]
+            except BufferError:
+                # önceki çerçevelerden biri hâlâ tutuluyor; yeni tampona geç
+                buf = self.buf = bytearray(buf[self.pos:])
+            self.pos = 0
+        try:
+            buf += data
+        except BufferError:
+            buf = self.buf = bytearray(buf[self.pos:]) + data
+            self.pos = 0
+
+        frames = []
+        view = memoryview(buf)
+        pos, search, n = self.pos, self.DELIMS.search, len(buf)
+        while True:
+            framed = pos < n and buf[pos] == 0x02      # pos STX'te: çerçeve içi, içerik pos+1'den başlar
+            start = pos + 1 if framed else pos
+            m = search(buf, start)
+            if not m:
+                break
+            end, c = m.start(), buf[m.start()]
+            if c == 0x03 and end + 1 >= n:
+                pos = end if not framed else pos      # BCC baytı bekleniyor
+                if not framed and end > start:
+                    frames.append(view[start:end]); pos = end
+                break
+            if c == 0x03 and framed:
+                if not AD2K_VERIFY_BCC or buf[end + 1] == ad2k_bcc(view[pos:end + 1]):
+                    if end > start:
+                        frames.append(view[start:end])
+                else:
+                    self.stats["bcc_errors"] += 1
+                pos = end + 2
+                continue
+            if end > start:
+                frames.append(view[start:end])
+            if c == 0x02:
+                pos = end                              # yeni çerçeve başlıyor
+            elif c == 0x03:
+                pos = end + 2                          # STX'siz ETX: BCC baytı atılır
+            else:
+                pos = end + 1
+        view.release()
+        if len(buf) - pos > self.max_bytes:
+            self.stats["dropped_bytes"] += len(buf) - pos
+            pos = len(buf)
+        self.pos = pos
+        self.stats["frames"] += len(frames)
+        self._views = frames
+        return frames
+
+    def clear(self):
+        self._release_views()
+        self.buf = bytearray()
+        self.pos = 0
+
 
 # !!! KAYBOLMASIN: Ağırlık satırlarını farklı biçimlerden çözen fonksiyon.
-def parse_weight_line(line):
-    if isinstance(line, bytes):
-        line = line.decode(errors="ignore")
-    s = (line or "").strip()
+# Desenler bir kez derlenir. Eski sürümdeki "ST,GS, 0.123 kg" deseninin önekleri tamamen isteğe bağlı
+# olduğundan yalın "0,123 kg" deseniyle aynı grubu yakalar; yalın "123 g" de bunun alt kümesidir.
+# 400000 g koruması da bir birim eşleşmesi gerektirir. Sıra: koruma -> birimli -> virgüllü -> eski kalıp.
+WEIGHT_GUARD_RE = re.compile(r'\b400000(?:[.,]00)?\s*g\b', re.IGNORECASE)
+WEIGHT_UNIT_RE = re.compile(r'([-+]?\d+(?:[.,]\d+)?)\s*(kg|g)\b', re.IGNORECASE)
+WEIGHT_COMMA_RE = re.compile(r'(?<!\d)(\d+),(\d{1,3})(?!\d)')
+WEIGHT_LEGACY_RE = re.compile(r'\b0000(\d),(\d{3})')
+# Öğrenilen satır kalıbının öneki bu karakterlerden biriyle bitemez: işaret sayıya katılır, harf/rakam
+# ise 400000 korumasındaki \b sınırını değiştirir. "ST,GS," gibi virgül/nokta ile biten önekler güvenlidir.
+_TEMPLATE_UNSAFE_TAIL = re.compile(r'[\w+\-]')
+# Önekin başındaki durum alanı (ST kararlı, US kararsız, OL aşım) satırdan satıra değişir; kalıpta
+# sabit metin yerine grup olarak tutulur ki durum değişince kalıp yeniden öğrenilmesin
+_STATUS_FIELD_RE = re.compile(r'(?:ST|US|OL)(?=,)')
+
+
+def _unit_grams(val: str, unit: str) -> Optional[int]:
+    v = float(val.replace(",", "."))
+    grams = int(round(v * 1000)) if unit.lower() == "kg" else int(round(v))
+    if abs(grams) < 5 or abs(grams) > MAX_REALISTIC_GRAMS:
+        return None
+    return grams
 
-    # Bilinen hatalı değer
-    if re.search(r'\b400000(?:[.,]00)?\s*g\b', s, re.IGNORECASE):
+
+def _comma_grams(whole: str, frac: str) -> Optional[int]:
+    grams = int(whole) * 1000 + int((frac + "00")[:3])
+    if grams < 5 or grams > MAX_REALISTIC_GRAMS:
         return None
+    return grams
 
-    # 1) "ST,GS, 0.123 kg" vb.
-    m = re.search(r'(?:ST|US|OL)?\s*,?\s*(?:GS|NT|TR)?\s*,?\s*([-+]?\d+(?:[.,]\d+)?)\s*(kg|g)\b', s, re.IGNORECASE)
-    if m:
-        val = m.group(1).replace(",", ".")
-        unit = m.group(2).lower()
-        try:
-            v = float(val)
-            grams = int(round(v * 1000)) if unit == "kg" else int(round(v))
-            if abs(grams) < 5 or abs(grams) > MAX_REALISTIC_GRAMS:
-                return None
-            return grams
-        except Exception:
-            pass
 
-    # 2) “0,123 kg” / “2.500 kg” / “123 g”
-    m = re.search(r'([-+]?\d+(?:[.,]\d+)?)\s*(kg|g)\b', s, re.IGNORECASE)
-    if m:
-        val = m.group(1).replace(",", ".")
-        unit = m.group(2).lower()
-        try:
-            v = float(val)
-            grams = int(round(v * 1000)) if unit == "kg" else int(round(v))
-            if abs(grams) < 5 or abs(grams) > MAX_REALISTIC_GRAMS:
-                return None
-            return grams
-        except Exception:
-            pass
+class WeightLineParser:
+    """
+    parse_weight_line'ın tek geçişli hali. Terazinin gönderdiği satır biçimi (sayı dışındaki sabit metin)
+    ilk başarılı çözümde öğrenilir; sonraki satırlar tek bir fullmatch ile doğrudan çözülür.
+    Kalıba uymayan satır genel yola düşer ve kalıp yeniden öğrenilir. Sonuçlar eski fonksiyonla birebir aynıdır.
+    """
 
-    # 3) “12,345” -> 12kg 345g
-    m = re.search(r'(?<!\d)(\d+),(\d{1,3})(?!\d)', s)
-    if m:
-        try:
-            whole = int(m.group(1))
-            frac = m.group(2)
-            while len(frac) < 3:
-                frac += "0"
-            frac = frac[:3]
-            grams = whole * 1000 + int(frac)
-            if grams < 5 or grams > MAX_REALISTIC_GRAMS:
+    def __init__(self):
+        self.template: Optional[re.Pattern] = None
+        self.template_kind = ""  # "unit" | "comma"
+        self.stats = {"fast": 0, "slow": 0, "learned": 0}
+
+    def parse(self, line) -> Optional[int]:
+        if isinstance(line, (bytes, bytearray, memoryview)):
+            line = str(line, "utf-8", "ignore")
+        s = (line or "").strip()
+
+        tpl = self.template
+        if tpl is not None:
+            m = tpl.fullmatch(s)
+            if m:
+                self.stats["fast"] += 1
+                if self.template_kind == "comma":
+                    return _comma_grams(m.group(1), m.group(2))
+                val = m.group(1)
+                if m.group(2) in ("g", "G") and val.lstrip("+-") in ("400000", "400000.00", "400000,00"):
+                    return None
+                return _unit_grams(val, m.group(2))
+        self.stats["slow"] += 1
+
+        if WEIGHT_GUARD_RE.search(s):
+            return None
+
+        m = WEIGHT_UNIT_RE.search(s)
+        if m:
+            self._learn(s, "unit", m)
+            return _unit_grams(m.group(1), m.group(2))
+
+        m = WEIGHT_COMMA_RE.search(s)
+        if m:
+            self._learn(s, "comma", m)
+            return _comma_grams(m.group(1), m.group(2))
+
+        m = WEIGHT_LEGACY_RE.search(s)
+        if m:
+            grams = int(m.group(1)) * 1000 + int(m.group(2))
+            if grams < 5 or abs(grams) > MAX_REALISTIC_GRAMS:
                 return None
             return grams
-        except Exception:
-            pass
 
-    # 4) Eski kalıp
-    m = re.search(r'\b0000(\d),(\d{3})', s)
-    if m:
-        kg = int(m.group(1)); gr = int(m.group(2))
-        grams = kg * 1000 + gr
-        if grams < 5 or abs(grams) > MAX_REALISTIC_GRAMS:
-            return None
-        return grams
+        return None
 
-    # 5) yalın “123 g”
-    m = re.search(r'(?<!\d)(-?\d+)\s*g\b', s, re.IGNORECASE)
-    if m:
-        grams = int(m.group(1))
-        if abs(grams) < 5 or abs(grams) > MAX_REALISTIC_GRAMS:
-            return None
-        return grams
+    def _learn(self, s: str, kind: str, m: re.Match):
+        # Yalnız ilk eşleşme satırdaki tek sayı olduğunda ve önek sayıya taşamayacağında öğrenilir
+        prefix, suffix = s[:m.start()], s[m.end():]
+        if prefix and _TEMPLATE_UNSAFE_TAIL.match(prefix[-1]):
+            return
+        if any(ch.isdigit() for ch in prefix) or any(ch.isdigit() for ch in suffix):
+            return
+        if kind == "unit":
+            between = s[m.end(1):m.start(2)]
+            body = r'([-+]?\d+(?:[.,]\d+)?)' + re.escape(between) + "(" + re.escape(m.group(2)) + ")"
+        else:
+            body = r'(\d+),(\d{1,3})'
+        status = _STATUS_FIELD_RE.match(prefix)
+        head = (_STATUS_FIELD_RE.pattern + re.escape(prefix[status.end():])) if status else re.escape(prefix)
+        self.template = re.compile(head + body + re.escape(suffix))
+        self.template_kind = kind
+        self.stats["learned"] += 1
+
+
+WEIGHT_PARSER = WeightLineParser()
 
-    return None
+
+def parse_weight_line(line):
+    return WEIGHT_PARSER.parse(line)
 
 # !!! KAYBOLMASIN: Stabilite kontrolü.
 def stable_value(stable_queue: deque, tolerance: int) -> bool:
@@ -301,6 +637,106 @@ def stable_value(stable_queue: deque, tolerance: int) -> bool:
         return False
     return (max(stable_queue) - min(stable_queue)) <= tolerance
 
+class StabilityDetector:
+    """
+    stable_value'nun O(1) hali: pencere min/max'ı monoton deque'larla tutulur, her okumada
+    tüm pencere taranmaz. Varsayılan ayarlarda karar stable_value(deque(maxlen=count), tolerance) ile aynıdır.
+    window_ms > 0 ise pencere zamanla belirlenir; kararlı sayılmak için gözlem en az window_ms sürmüş
+    ve pencerede en az count okuma olmalıdır.
+    update() kararlıysa basılacak değeri (süzgeçten geçmiş son okuma), değilse None döner; geçerli okuma
+    süzgeçte atıldı ya da doğrulama için bekletildiyse kararlı sayılmaz.
+    """
+
+    def __init__(self, count: int = STABLE_COUNT, tolerance: int = SENSITIVITY_GRAM,
+                 window_ms: int = STABLE_WINDOW_MS, outlier_filter: str = STABLE_FILTER,
+                 spike_grams: int = STABLE_SPIKE_GRAMS):
+        self.count = count
+        self.tolerance = tolerance
+        self.window = window_ms / 1000.0
+        self.outlier_filter = outlier_filter
+        self.spike_grams = spike_grams
+        self.clear()
+
+    def clear(self):
+        self._seq = 0                                   # eklenen okuma sayısı (sıra numarası)
+        self._samples: deque = deque()                  # (sıra, zaman) pencere içindekiler
+        self._max: deque = deque()                      # (sıra, değer) azalan
+        self._min: deque = deque()                      # (sıra, değer) artan
+        self._since: Optional[float] = None
+        self._recent: deque = deque(maxlen=3)           # median3 için ham okumalar
+        self._last: Optional[int] = None                # spike için son kabul edilen okuma
+        self._pending: Optional[int] = None             # spike için doğrulama bekleyen sıçrama
+        self.stable = False
+        self.value: Optional[int] = None
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def _filtered(self, grams: int) -> List[int]:
+        # Süzgeçten geçen okumalar (spike süzgecinde doğrulanan sıçrama ile birlikte iki okuma olabilir)
+        if self.outlier_filter == "median3":
+            self._recent.append(grams)
+            return [sorted(self._recent)[len(self._recent) // 2]]
+        if self.outlier_filter == "spike":
+            if self._pending is not None:
+                pending, self._pending = self._pending, None
+                if abs(grams - pending) <= self.tolerance:
+                    self._last = grams
+                    return [pending, grams]
+                self.rejected += 1              # sıçrama tekrarlanmadı: arıza okuması
+            if self._last is not None and abs(grams - self._last) > self.spike_grams:
+                self._pending = grams
+                return []
+            self._last = grams
+        return [grams]
+
+    def _push(self, grams: int, now: float):
+        seq = self._seq
+        self._seq += 1
+        self._samples.append((seq, now))
+        while self._max and self._max[-1][1] <= grams:
+            self._max.pop()
+        self._max.append((seq, grams))
+        while self._min and self._min[-1][1] >= grams:
+            self._min.pop()
+        self._min.append((seq, grams))
+        if self._since is None:
+            self._since = now
+
+    def _evict(self, now: float):
+        samples = self._samples
+        if self.window > 0:
+            limit = now - self.window
+            while samples and samples[0][1] < limit:
+                samples.popleft()
+        else:
+            while len(samples) > self.count:
+                samples.popleft()
+        if not samples:
+            self._max.clear(); self._min.clear()
+            return
+        first = samples[0][0]
+        while self._max[0][0] < first:
+            self._max.popleft()
+        while self._min[0][0] < first:
+            self._min.popleft()
+
+    def update(self, grams: int, now: Optional[float] = None) -> Optional[int]:
+        now = time.monotonic() if now is None else now
+        accepted = self._filtered(grams)
+        for g in accepted:
+            self._push(g, now)
+        self._evict(now)
+        if not accepted or len(self._samples) < self.count:
+            self.stable = False
+        elif self.window > 0 and now - self._since < self.window:
+            self.stable = False
+        else:
+            self.stable = (self._max[0][1] - self._min[0][1]) <= self.tolerance
+        self.value = accepted[-1] if self.stable else None
+        return self.value
+
 # -------- Barkod (EAN-13) --------
 EAN_L = {'0': "0001101",'1': "0011001",'2': "0010011",'3': "0111101",'4': "0100011",'5': "0110001",'6': "0101111",'7': "0111011",'8': "0110111",'9': "0001011"}
 EAN_G = {'0': "0100111",'1': "0110011",'2': "0011011",'3': "0100001",'4': "0011101",'5': "0111001",'6': "0000101",'7': "0010001",'8': "0001001",'9': "0010111"}
@@ -314,67 +750,283 @@ def ean13_check_digit(data12: str) -> str:
         s += n if (i % 2) == 0 else 3 * n
     return str((10 - (s % 10)) % 10)
 
-def draw_ean13(canvas: Image.Image, x: int, y: int, width: int, height: int, data: str, font: ImageFont.ImageFont):
-    draw = ImageDraw.Draw(canvas)
-    digits = "".join(ch for ch in (data or "") if ch.isdigit())
-    if len(digits) not in (12, 13):
-        draw.rectangle([x, y, x+width, y+height], outline=(0,0,0), width=2)
-        draw.text((x+4, y+height- font.size - 2), digits or "EAN13?", font=font, fill=(0,0,0))
-        return
-    if len(digits) == 12:
-        digits += ean13_check_digit(digits)
+def weight_ean13(item_code: str, grams: int, prefix: str = WEIGHT_BARCODE_PREFIX) -> Optional[str]:
+    # "28" + 5 haneli ürün kodu + 5 haneli gram + kontrol; sığmıyorsa None
+    weight_digits = 12 - len(prefix) - WEIGHT_BARCODE_ITEM_DIGITS
+    if not (item_code.isdigit() and len(item_code) <= WEIGHT_BARCODE_ITEM_DIGITS):
+        return None
+    if not 0 <= grams < 10 ** weight_digits:
+        return None
+    data12 = f"{prefix}{item_code.zfill(WEIGHT_BARCODE_ITEM_DIGITS)}{grams:0{weight_digits}d}"
+    return data12 + ean13_check_digit(data12)
+
+def weight_item_code(payload: Dict[str, Any]) -> Optional[str]:
+    """
+    Ürünün terazi kodunu payload'dan bulur: açık alanlar (plu/item_code/scale_code) ya da
+    sunucunun ürettiği ağırlık gömülü barkodun ürün haneleri.
+    """
+    for key in ("plu", "item_code", "scale_code"):
+        v = str(payload.get(key) or "").strip()
+        if v.isdigit() and len(v) <= WEIGHT_BARCODE_ITEM_DIGITS:
+            return v
+    bc = re.sub(r"\D", "", str(payload.get("barcode") or ""))
+    if len(bc) in (12, 13) and bc.startswith(WEIGHT_BARCODE_PREFIX):
+        start = len(WEIGHT_BARCODE_PREFIX)
+        return bc[start:start + WEIGHT_BARCODE_ITEM_DIGITS]
+    return None
 
-    modules = 95
-    mw = max(1, width // modules)
-    bw = modules * mw
-    x0 = x + (width - bw) // 2
+def format_weight_str(grams: int) -> str:
+    return WEIGHT_STR_FORMAT.format(kg=grams / 1000.0, g=grams)
+
+def local_weight_mismatch(payload: Dict[str, Any], item_code: str, grams: int) -> Optional[str]:
+    """
+    Sunucunun bu tartım için döndürdüğü barkod ve weight_str yerelde aynen üretilebiliyor mu:
+    aynıysa None, değilse farkı anlatan metin (önek/ürün kodu/biçim sunucudakinden farklı demektir).
+    """
+    server_bc = ean13_digits(str(payload.get("barcode") or ""))
+    local_bc = weight_ean13(item_code, grams)
+    if server_bc != local_bc:
+        return f"barkod sunucu={payload.get('barcode')!r} yerel={local_bc!r}"
+    server_ws = str(payload.get("weight_str") or "").strip()
+    local_ws = format_weight_str(grams)
+    if server_ws != local_ws:
+        return f"weight_str sunucu={server_ws!r} yerel={local_ws!r}"
+    return None
 
-    first = digits[0]; left = digits[1:7]; right = digits[7:]
-    parity = EAN_PARITY.get(first, "LLLLLL")
+EAN13_CACHE_SIZE = int(os.getenv("EAN13_CACHE_SIZE", "64"))
 
-    pattern = "101"
-    for i, ch in enumerate(left):
-        pattern += (EAN_L if parity[i]=='L' else EAN_G)[ch]
-    pattern += "01010"
-    for ch in right:
-        pattern += EAN_R[ch]
-    pattern += "101"
+@functools.lru_cache(maxsize=256)
+def ean13_bar_runs(digits13: str) -> Tuple[Tuple[int, int], ...]:
+    # 95 modüllük deseni (başlangıç modülü, genişlik) koyu çubuk koşularına çevirir
+    first = digits13[0]; left = digits13[1:7]; right = digits13[7:]
+    parity = EAN_PARITY.get(first, "LLLLLL")
+    pattern = "".join(
+        ["101"]
+        + [(EAN_L if parity[i] == 'L' else EAN_G)[ch] for i, ch in enumerate(left)]
+        + ["01010"]
+        + [EAN_R[ch] for ch in right]
+        + ["101"]
+    )
+    runs = []
+    i = 0
+    while i < len(pattern):
+        if pattern[i] == '1':
+            j = pattern.index('0', i) if '0' in pattern[i:] else len(pattern)
+            runs.append((i, j - i))
+            i = j
+        else:
+            i += 1
+    return tuple(runs)
 
+def ean13_geometry(width: int, height: int) -> Tuple[int, int, int]:
+    # Kutu içinde (çubukların x başlangıcı, modül genişliği, çubuk yüksekliği - 1)
+    modules = 95
+    mw = max(1, width // modules)
     text_h = max(12, int(height * 0.18))
-    bar_h = max(1, height - text_h - 4)
+    return (width - modules * mw) // 2, mw, max(1, height - text_h - 4)
+
+@functools.lru_cache(maxsize=EAN13_CACHE_SIZE)
+def ean13_mask(digits13: str, width: int, height: int, font: ImageFont.ImageFont,
+               mode: str, bars: bool = True) -> Tuple[Image.Image, int, int]:
+    """
+    Barkodun (çubuklar + okunur rakamlar) mürekkep örtüsünü "L" maske olarak döndürür: (maske, dx, dy).
+    (dx, dy) maskenin draw_ean13'teki (x, y)'ye göre konumudur. Maske, canvas.paste(INK, ..., maske) ile
+    basıldığında çubukları ve metni doğrudan çizmekle aynı pikselleri verir. bars=False: yalnız rakamlar.
+    """
+    x0, mw, bar_h = ean13_geometry(width, height)
+    bw = 95 * mw
+    num_text = f"{digits13[0]} {digits13[1:7]} {digits13[7:]}"
+    meas = _measure_draw(mode, "1" if mode == "1" else "L")
+    tw = int(meas.textlength(num_text, font=font))
+    tx, ty = x0 + (bw - tw) // 2, bar_h + 2
+    l, t, r, b = meas.textbbox((tx, ty), num_text, font=font)
+    ox, oy = min(x0, l), min(0, t)
+    img = Image.new(mode, (max(x0 + bw, r) - ox, max(bar_h + 1, b) - oy), PAPER)
+    draw = ImageDraw.Draw(img)
+    for m0, n in (ean13_bar_runs(digits13) if bars else ()):
+        x1 = x0 + m0 * mw - ox
+        draw.rectangle([x1, -oy, x1 + n * mw - 1, bar_h - oy], fill=INK)
+    draw.text((tx - ox, ty - oy), num_text, font=font, fill=INK)
+    return ImageChops.invert(img.convert("L")), ox, oy
+
+def ean13_digits(data: str) -> Optional[str]:
+    digits = "".join(ch for ch in (data or "") if ch.isdigit())
+    if len(digits) == 12:
+        return digits + ean13_check_digit(digits)
+    return digits if len(digits) == 13 else None
 
-    for i, bit in enumerate(pattern):
-        if bit == '1':
-            x1 = x0 + i * mw
-            draw.rectangle([x1, y, x1 + mw - 1, y + bar_h], fill=(0,0,0))
+def draw_ean13(canvas: Image.Image, x: int, y: int, width: int, height: int, data: str, font: ImageFont.ImageFont,
+               bars: bool = True):
+    digits = "".join(ch for ch in (data or "") if ch.isdigit())
+    if len(digits) not in (12, 13):
+        draw = ImageDraw.Draw(canvas)
+        draw.rectangle([x, y, x+width, y+height], outline=INK, width=2)
+        draw.text((x+4, y+height- font.size - 2), digits or "EAN13?", font=font, fill=INK)
+        return
+    if len(digits) == 12:
+        digits += ean13_check_digit(digits)
+    mask, dx, dy = ean13_mask(digits, width, height, font, canvas.mode, bars)
+    canvas.paste(INK, (x + dx, y + dy), mask)
 
-    num_text = f"{first} {left} {right}"
-    tw = int(draw.textlength(num_text, font=font))
-    draw.text((x0 + (bw - tw)//2, y + bar_h + 2), num_text, font=font, fill=(0,0,0))
+def draw_ean13_bars(canvas: Image.Image, x: int, y: int, width: int, height: int, data: str):
+    # native_barcode ile çizilmiş etikete yalnız çubukları ekler; sonuç draw_ean13(bars=True) ile aynı piksellerdir
+    digits = ean13_digits(data)
+    if not digits:
+        return
+    x0, mw, bar_h = ean13_geometry(width, height)
+    draw = ImageDraw.Draw(canvas)
+    for m0, n in ean13_bar_runs(digits):
+        x1 = x + x0 + m0 * mw
+        draw.rectangle([x1, y, x1 + n * mw - 1, y + bar_h], fill=INK)
 
 # -------- Metin yardımcıları --------
+# Kelime genişlikleri (font, çizim modu, kelime) başına bir kez ölçülür; satırlar bu genişliklerin
+# toplamıyla kurulur. Toplam ile gerçek genişlik arasındaki kerning farkı birleşim başına
+# WRAP_KERN_SLACK_PX ile sınırlanır; yalnız satır sonuna bu kadar yakın adaylar tam ölçülür.
+WORD_WIDTH_CACHE_SIZE = int(os.getenv("WORD_WIDTH_CACHE_SIZE", "4096"))
+WRAP_KERN_SLACK_PX = _env_float("WRAP_KERN_SLACK_PX", 1.0)
+
+@functools.lru_cache(maxsize=4)
+def _measure_draw(mode: str, fontmode: str) -> ImageDraw.ImageDraw:
+    d = ImageDraw.Draw(Image.new(mode, (1, 1)))
+    d.fontmode = fontmode
+    return d
+
+@functools.lru_cache(maxsize=WORD_WIDTH_CACHE_SIZE)
+def _cached_text_width(font: ImageFont.ImageFont, mode: str, fontmode: str, text: str) -> float:
+    return _measure_draw(mode, fontmode).textlength(text, font=font)
+
+def text_width(draw: ImageDraw.ImageDraw, text: str, font: ImageFont.ImageFont) -> float:
+    return _cached_text_width(font, draw.mode, draw.fontmode, text)
+
+def word_width_cache_info() -> Dict[str, int]:
+    ci = _cached_text_width.cache_info()
+    return {"hits": ci.hits, "misses": ci.misses, "size": ci.currsize, "maxsize": ci.maxsize}
+
+class _LineFitter:
+    """
+    Açgözlü satır kurucu: add(w) kelimeyi mevcut satıra sığıyorsa ekleyip True döner.
+    Genişlik toplamdan tahmin edilir; tam ölçüm yalnız tahmin max_width'e slack kadar yakınsa yapılır.
+    Karar, her adayı baştan ölçen eski döngüyle aynıdır.
+    """
+    def __init__(self, draw: ImageDraw.ImageDraw, font: ImageFont.ImageFont, max_width: float):
+        self.draw, self.font, self.max_width = draw, font, max_width
+        self.space_w = text_width(draw, " ", font)
+        self.reset()
+
+    def reset(self, word: str = ""):
+        self.buf = word
+        self.width = text_width(self.draw, word, self.font) if word else 0.0
+        self.joins = 0      # son tam ölçümden bu yana eklenen birleşim sayısı
+
+    def add(self, word: str) -> bool:
+        ww = text_width(self.draw, word, self.font)
+        if not self.buf:
+            cand, est, joins = word, ww, 0
+        else:
+            cand, est, joins = f"{self.buf} {word}", self.width + self.space_w + ww, self.joins + 1
+        slack = WRAP_KERN_SLACK_PX * joins
+        if est + slack <= self.max_width:
+            fits = True
+        elif joins and est - slack <= self.max_width:
+            est = self.draw.textlength(cand, font=self.font)
+            joins = 0
+            fits = est <= self.max_width
+        else:
+            fits = False
+        if fits:
+            self.buf, self.width, self.joins = cand, est, joins
+        return fits
+
 def text_wrap(draw: ImageDraw.ImageDraw, text: str, font: ImageFont.ImageFont, max_width: int) -> str:
     if not text:
         return ""
     lines: List[str] = []
+    lf = _LineFitter(draw, font, max_width)
     for para in text.splitlines():
         if not para:
             lines.append("")
             continue
-        words = para.split(" ")
-        buf = ""
-        for w in words:
-            cand = w if not buf else f"{buf} {w}"
-            if draw.textlength(cand, font=font) <= max_width:
-                buf = cand
-            else:
-                if buf:
-                    lines.append(buf)
-                buf = w
-        if buf:
-            lines.append(buf)
+        lf.reset()
+        for w in para.split(" "):
+            if not lf.add(w):
+                if lf.buf:
+                    lines.append(lf.buf)
+                lf.reset(w)
+        if lf.buf:
+            lines.append(lf.buf)
     return "\n".join(lines)
 
+def fit_font_size(draw: ImageDraw.ImageDraw, lines: List[str], path: Optional[str], max_width: int,
+                  hi: int, lo: int) -> int:
+    """
+    lines'ın hepsinin max_width'e sığdığı en büyük boyutu [lo, hi] aralığında bulur; hiçbiri sığmazsa lo - 1.
+    hi boyutundaki tek ölçümden genişlik boyutla doğrusal varsayılarak tahmin yapılır, kalan aralık
+    ikili aramayla daraltılır (tipik 2-4 ölçüm; adım adım küçültmeyle aynı sonuç).
+    """
+    def width(size: int) -> float:
+        f = load_font_exact(path, size)
+        return max(draw.textlength(ln, font=f) for ln in lines)
+
+    w_hi = width(hi)
+    if w_hi <= max_width:
+        return hi
+    good, bad = lo - 1, hi          # good: sığan (ya da taban), bad: sığmayan
+    est = min(hi - 1, max(lo, int(hi * max_width / w_hi))) if w_hi > 0 else lo
+    # Tahmin çoğunlukla en fazla iki adım uzakta: tahminden sınır bulunana kadar (en çok 3 ölçüm) yürü
+    cand = est
+    step = 1 if width(cand) <= max_width else -1
+    if step > 0:
+        good = cand
+    else:
+        bad = cand
+    for _ in range(2):
+        cand += step
+        if not (good < cand < bad):
+            break
+        if width(cand) <= max_width:
+            good = cand
+            if step < 0:
+                break
+        else:
+            bad = cand
+            if step > 0:
+                break
+    while bad - good > 1:
+        mid = (good + bad) // 2
+        if width(mid) <= max_width:
+            good = mid
+        else:
+            bad = mid
+    return good
+
+def split_two_lines(text: str) -> Optional[Tuple[str, str]]:
+    # Karakter sayısı en dengeli kelime sınırından böl
+    words = text.split()
+    if len(words) < 2:
+        return None
+    best = min(range(1, len(words)),
+               key=lambda i: max(len(" ".join(words[:i])), len(" ".join(words[i:]))))
+    return " ".join(words[:best]), " ".join(words[best:])
+
+def fit_product_title(draw: ImageDraw.ImageDraw, text: str, path: Optional[str], max_width: int, max_height: int,
+                      hi: int, lo: int = PRODUCT_TITLE_MIN_SIZE,
+                      wrap: Optional[bool] = None) -> Tuple[List[str], ImageFont.ImageFont]:
+    # Tek satır sığmıyorsa ve wrap açıksa, yükseklik izin verdiği sürece daha büyük yazan iki satır tercih edilir
+    if wrap is None:
+        wrap = PRODUCT_TITLE_WRAP
+    size = fit_font_size(draw, [text], path, max_width, hi, lo)
+    lines = [text]
+    if wrap and size < hi:
+        parts = split_two_lines(text)
+        if parts:
+            two_hi = min(hi, (max_height - PRODUCT_TITLE_LINE_GAP_PX) // 2)
+            if two_hi > size:
+                two = fit_font_size(draw, list(parts), path, max_width, two_hi, size + 1)
+                if two > size:
+                    size, lines = two, list(parts)
+    return lines, load_font_exact(path, size)
+
 def _startswith_ci(s: str, pref: str) -> bool:
     return s.casefold().startswith(pref.casefold())
 
@@ -388,7 +1040,7 @@ def draw_line_with_bold_prefix(draw: ImageDraw.ImageDraw, x: int, y: int, max_w:
             matched = p
             break
     if not matched:
-        draw.text((x, y), line, font=font_regular, fill=(0,0,0))
+        draw.text((x, y), line, font=font_regular, fill=INK)
         return font_regular.size + spacing, 0
 
     s = line.strip()
@@ -399,23 +1051,21 @@ def draw_line_with_bold_prefix(draw: ImageDraw.ImageDraw, x: int, y: int, max_w:
     pref_w = int(draw.textlength(prefix, font=font_bold))
     line_h = font_regular.size + spacing
 
-    draw.text((x, y), prefix, font=font_bold, fill=(0,0,0))
+    draw.text((x, y), prefix, font=font_bold, fill=INK)
 
     remain_w = max(0, max_w - pref_w - 4)
     if remain_w <= 0 or not rest:
         return line_h, 0
 
     words = rest.split(" ")
-    buf = ""
+    lf = _LineFitter(draw, font_regular, remain_w)
     idx = 0
     for i, w in enumerate(words):
-        cand = w if not buf else f"{buf} {w}"
-        if draw.textlength(cand, font=font_regular) <= remain_w:
-            buf = cand
-            idx = i + 1
-        else:
+        if not lf.add(w):
             break
-    draw.text((x + pref_w + 4, y), buf, font=font_regular, fill=(0,0,0))
+        idx = i + 1
+    buf = lf.buf
+    draw.text((x + pref_w + 4, y), buf, font=font_regular, fill=INK)
 
     rest_tail = " ".join(words[idx:])
     used_h = line_h
@@ -423,13 +1073,19 @@ def draw_line_with_bold_prefix(draw: ImageDraw.ImageDraw, x: int, y: int, max_w:
     if rest_tail:
         wrapped = text_wrap(draw, rest_tail, font=font_regular, max_width=max_w)
         for ln in wrapped.splitlines():
-            draw.text((x, yy), ln, font=font_regular, fill=(0,0,0))
+            draw.text((x, yy), ln, font=font_regular, fill=INK)
             yy += font_regular.size + spacing
             used_h += font_regular.size + spacing
 
     return used_h, 0
 
 # -------- Görsel bileşimi --------
+def barcode_box(width_dots: int, inner_dx_dots: int = 0, inner_dy_dots: int = 0) -> Tuple[int, int, int, int]:
+    # Sağ sütundaki barkod kutusu: (x, genişlik, üst, yükseklik) — compose_label ve hibrit çıktı ortak kullanır
+    right_x = LEFT_MARGIN + LEFT_COL_WIDTH + COL_GAP + inner_dx_dots
+    right_w = max(200, width_dots - right_x - LEFT_MARGIN - max(0, -inner_dx_dots))
+    return right_x, right_w, LEFT_BLOCK_Y + inner_dy_dots, RIGHT_BARCODE_HEIGHT
+
 def compose_label(
     data: Dict[str, Any],
     width_dots: int,
@@ -437,8 +1093,20 @@ def compose_label(
     forbid_bottom_px: int,
     inner_dx_dots: int = 0,
     inner_dy_dots: int = 0,
-    debug_frame: bool = False
+    debug_frame: bool = False,
+    mode: str = RENDER_MODE,
+    rotate_180: bool = ROTATE_180,
+    layer: str = "all",
+    native_barcode: bool = False
 ) -> Image.Image:
+    """
+    native_barcode: EAN-13 çubukları çizilmez (yazıcı GS k ile basar), yalnız okunur rakamlar çizilir.
+    layer: "all" tüm etiketi çizer. "static" tartımdan tartıma değişmeyen her şeyi (başlık, etiket adları,
+    içindekiler, notlar), "variable" yalnız VARIABLE_FIELDS değerlerini (Ağırlık/S.T.T. değerleri ve EAN-13)
+    çizer. Yerleşim iki katmanda aynıdır; üst üste bindirilince "all" ile aynı sonuç verir.
+    """
+    static = layer in ("all", "static")
+    variable = layer in ("all", "variable")
     fonts = get_fonts_for_sizes(
         size_title=34,
         size_sub=28,
@@ -457,22 +1125,24 @@ def compose_label(
     f_head_b = fonts["head_b"]
     f_bar    = fonts["bar"]
 
-    canvas = Image.new("RGB", (width_dots, height_dots), (255, 255, 255))
+    canvas = Image.new(mode, (width_dots, height_dots), PAPER)
     draw = ImageDraw.Draw(canvas)
 
-    if debug_frame:
-        draw.rectangle([1, 1, width_dots-2, height_dots-2], outline=(0,0,0), width=2)
+    if debug_frame and static:
+        draw.rectangle([1, 1, width_dots-2, height_dots-2], outline=INK, width=2)
 
     # Sol blok
     y = LEFT_BLOCK_Y + inner_dy_dots
     left_x = LEFT_MARGIN + inner_dx_dots
 
-    def draw_label_value(label_text: str, value_text: str, value_bold: bool = True):
+    def draw_label_value(label_text: str, value_text: str, value_bold: bool = True, value_variable: bool = False):
         nonlocal y
-        lw = int(draw.textlength(label_text, font=f_label))
-        draw.text((left_x, y), label_text, font=f_label, fill=(0,0,0))
-        vx = left_x + lw + LABEL_VALUE_GAP_PX
-        draw.text((vx, y), value_text, font=(f_sub_b if value_bold else f_sub), fill=(0,0,0))
+        if static:
+            draw.text((left_x, y), label_text, font=f_label, fill=INK)
+        if (variable if value_variable else static):
+            lw = int(text_width(draw, label_text, f_label))
+            vx = left_x + lw + LABEL_VALUE_GAP_PX
+            draw.text((vx, y), value_text, font=(f_sub_b if value_bold else f_sub), fill=INK)
         y += LEFT_BLOCK_GAP
 
     # Adet: 1 ise hiç yazdırma
@@ -484,27 +1154,27 @@ def compose_label(
     if count_val not in (1, None):
         draw_label_value("Adet:", str(count_raw), value_bold=False)
 
-    draw_label_value("Ağırlık:", str(data.get("weight_str", "")), value_bold=True)
-    draw_label_value("S.T.T.:", str(data.get("expiry", "")), value_bold=True)
+    draw_label_value("Ağırlık:", str(data.get("weight_str", "")), value_bold=True, value_variable=True)
+    draw_label_value("S.T.T.:", str(data.get("expiry", "")), value_bold=True, value_variable=True)
 
     # Sağ sütun: başlık + barkod
-    right_x = LEFT_MARGIN + LEFT_COL_WIDTH + COL_GAP + inner_dx_dots
-    right_w = max(200, width_dots - right_x - LEFT_MARGIN - max(0, -inner_dx_dots))
-    bar_top = LEFT_BLOCK_Y + inner_dy_dots
-    bar_h = RIGHT_BARCODE_HEIGHT
+    right_x, right_w, bar_top, bar_h = barcode_box(width_dots, inner_dx_dots, inner_dy_dots)
 
     product = str(data.get("product_name", "") or "").strip()
-    if product:
-        size = f_title_b.size
-        bold_path = fonts["_paths"]["bold"]
-        while size >= 22 and draw.textlength(product, font=load_font_exact(bold_path, size)) > right_w:
-            size -= 1
-        f_prod = load_font_exact(bold_path, size)
+    if product and static:
+        prod_lines, f_prod = fit_product_title(
+            draw, product, fonts["_paths"]["bold"], right_w,
+            max_height=bar_top - PRODUCT_TITLE_GAP_PX - PRODUCT_TITLE_TOP_SAFE_PX, hi=f_title_b.size
+        )
+        line_h = f_prod.size + PRODUCT_TITLE_LINE_GAP_PX
         # Üstten kesilmemesi için min üst güvenlik boşluğunu uygula
-        prod_y = max(PRODUCT_TITLE_TOP_SAFE_PX, bar_top - f_prod.size - PRODUCT_TITLE_GAP_PX)
-        draw.text((right_x, prod_y), product, font=f_prod, fill=(0,0,0))
+        prod_y = max(PRODUCT_TITLE_TOP_SAFE_PX, bar_top - f_prod.size - PRODUCT_TITLE_GAP_PX - line_h * (len(prod_lines) - 1))
+        for i, ln in enumerate(prod_lines):
+            draw.text((right_x, prod_y + i * line_h), ln, font=f_prod, fill=INK)
 
-    draw_ean13(canvas, right_x, bar_top, right_w, bar_h, str(data.get("barcode", "")), f_bar)
+    if variable:
+        draw_ean13(canvas, right_x, bar_top, right_w, bar_h, str(data.get("barcode", "")), f_bar,
+                   bars=not native_barcode)
 
     # İç metin başlangıcı
     last_left_y = y - (LEFT_BLOCK_GAP - f_label.size)
@@ -515,7 +1185,7 @@ def compose_label(
     block_h = max(0, safe_h - text_top - 8)
     block_w = width_dots - 2*LEFT_MARGIN
 
-    if block_h > 0:
+    if block_h > 0 and static:
         yy = text_top
 
         # Ingredients header (bold, +2 px)
@@ -525,7 +1195,7 @@ def compose_label(
             for ln in header_wrapped.splitlines():
                 lh = f_head_b.size + 6
                 if yy + lh > text_top + block_h: break
-                draw.text((LEFT_MARGIN, yy), ln, font=f_head_b, fill=(0,0,0))
+                draw.text((LEFT_MARGIN, yy), ln, font=f_head_b, fill=INK)
                 yy += lh
             yy += 2
 
@@ -548,7 +1218,7 @@ def compose_label(
                     for ln in wrapped.splitlines():
                         lh = f_text_b.size + 6
                         if yy + lh > text_top + block_h: break
-                        draw.text((LEFT_MARGIN, yy), ln, font=f_text_b, fill=(0,0,0))
+                        draw.text((LEFT_MARGIN, yy), ln, font=f_text_b, fill=INK)
                         yy += lh
 
                     # Hemen sonraki dolu satırı da (varsa) bold çiz – sadece 1 satır
@@ -559,7 +1229,7 @@ def compose_label(
                             for ln in wrapped2.splitlines():
                                 lh = f_text_b.size + 6
                                 if yy + lh > text_top + block_h: break
-                                draw.text((LEFT_MARGIN, yy), ln, font=f_text_b, fill=(0,0,0))
+                                draw.text((LEFT_MARGIN, yy), ln, font=f_text_b, fill=INK)
                                 yy += lh
                             i += 1  # ikinci satırı tükettik
                     i += 1
@@ -578,7 +1248,7 @@ def compose_label(
                     for ln in wrapped.splitlines():
                         lh = f_text.size + 6
                         if yy + lh > text_top + block_h: break
-                        draw.text((LEFT_MARGIN, yy), ln, font=f_text, fill=(0,0,0))
+                        draw.text((LEFT_MARGIN, yy), ln, font=f_text, fill=INK)
                         yy += lh
                 i += 1
             return yy
@@ -594,43 +1264,58 @@ def compose_label(
         if notes and yy < text_top + block_h:
             yy = render_lines_with_allergen_rule(notes.split("\n"), yy, notes_mode=True)
 
-    if ROTATE_180:
+    if rotate_180:
         canvas = canvas.rotate(180, expand=False)
     return canvas
 
 # -------- Görsel/raster yardımcıları --------
-def shift_image_vertical(img: Image.Image, dy: int, fill=(255, 255, 255)) -> Image.Image:
-    w, h = img.size
-    out = Image.new(img.mode, (w, h), fill)
-    out.paste(img, (0, dy))
-    return out
+# 1-bit paketleme motoru: eşikleme + ters çevirme + MSB-first paketleme tek C geçişinde.
+# Çıktı bayt bayt eski piksel döngüsüyle aynıdır (1 = siyah nokta, satır sonu 0 ile dolar).
+def _threshold_lut(threshold: int, invert: bool) -> List[int]:
+    # "1" modunda 255 -> bit 1; yazıcıda bit 1 siyah nokta demek
+    return [255 if ((p < threshold) ^ invert) else 0 for p in range(256)]
+
+def _pack_1bit_py(gray: Image.Image, threshold: int, invert: bool) -> bytes:
+    # Yedek yol (Pillow "L"->"1" point desteklemezse): saf Python, satır satır
+    w, h = gray.size
+    width_bytes = (w + 7) // 8
+    raw = bytearray(width_bytes * h)
+    px = gray.tobytes()
+    for y in range(h):
+        row = px[y * w:(y + 1) * w]
+        off = y * width_bytes
+        for xb in range(width_bytes):
+            group = row[xb * 8:xb * 8 + 8]
+            val = 0
+            for p in group:
+                val = (val << 1) | (1 if ((p < threshold) ^ invert) else 0)
+            raw[off + xb] = val << (8 - len(group))
+    return bytes(raw)
+
+def pack_1bit(img: Image.Image, threshold: int = THRESHOLD, invert: bool = INVERT_BW,
+              reverse_bits: bool = False) -> bytes:
+    # reverse_bits: bayt içi bit sırası ters (LSB-first) paketlenir; 180° döndürmede kullanılır
+    rawmode = "1;R" if reverse_bits else "1"
+    if img.mode == "1" and img.width % 8 == 0:
+        # "1" tuvali zaten eşiklenmiş: Pillow'da bit 1 beyaz, yazıcıda siyah -> ";I" ile ters paketle
+        if not invert:
+            rawmode = "1;IR" if reverse_bits else "1;I"
+        return img.tobytes("raw", rawmode)
+    gray = img if img.mode == "L" else img.convert("L")
+    try:
+        return gray.point(_threshold_lut(threshold, invert), "1").tobytes("raw", rawmode)
+    except Exception:
+        raw = _pack_1bit_py(gray, threshold, invert)
+        return raw.translate(_BITREV) if reverse_bits else raw
 
 def to_1bit_bytes(img: Image.Image, width_dots: int, threshold: int = THRESHOLD, invert: bool = INVERT_BW) -> Tuple[bytes, int, int]:
     w, h = img.size
     assert w == width_dots, f"Image width {w} != {width_dots}"
-    bw = img.convert("L").point(lambda p: 0 if p < threshold else 255, "L")
-    width_bytes = width_dots // 8
-    raw = bytearray(width_bytes * h)
-    p = bw.load()
-    for y in range(h):
-        off = y * width_bytes
-        val = 0
-        bitc = 0
-        xb = 0
-        for x in range(width_dots):
-            bit = 1 if ((p[x, y] == 0) ^ invert) else 0
-            val = ((val << 1) | bit) & 0xFF
-            bitc += 1
-            if bitc == 8:
-                raw[off + xb] = val
-                val = 0
-                bitc = 0
-                xb += 1
-    return bytes(raw), width_bytes, h
-
-def pad_rows_to_device_width(raw: bytes, label_wb: int, device_wb: int, rows: int, align: str = "center", left_shift_dots: int = 0) -> bytes:
-    assert device_wb >= label_wb
-    out = bytearray(device_wb * rows)
+    return pack_1bit(img, threshold=threshold, invert=invert), width_dots // 8, h
+
+_BITREV = bytes(int(f"{i:08b}"[::-1], 2) for i in range(256))
+
+def device_pad_left(label_wb: int, device_wb: int, align: str = "center", left_shift_dots: int = 0) -> int:
     pad_total = device_wb - label_wb
     if align == "left":
         pad_left = 0
@@ -640,11 +1325,361 @@ def pad_rows_to_device_width(raw: bytes, label_wb: int, device_wb: int, rows: in
         pad_left = pad_total // 2
     if left_shift_dots > 0:
         pad_left = max(0, min(pad_total, pad_left - left_shift_dots))
-    for r in range(rows):
-        src_off = r * label_wb
-        dst_off = r * device_wb + pad_left
-        out[dst_off:dst_off + label_wb] = raw[src_off:src_off + label_wb]
-    return bytes(out)
+    return pad_left
+
+class DeviceRaster:
+    """
+    Cihaz genişliğinde (DEVICE_WIDTH_BYTES) tek seferde ayrılan raster tamponu.
+    Etiket satırları align/left_shift_dots dolgusu, 180° döndürme ve dikey kayma uygulanmış
+    olarak doğrudan yerine yazılır; gönderim `view` dilimleriyle kopyasız yapılır.
+    """
+
+    def __init__(self, rows: int, label_wb: int, device_wb: int = DEVICE_WIDTH_BYTES,
+                 align: str = "center", left_shift_dots: int = 0):
+        assert device_wb >= label_wb
+        self.rows = rows
+        self.label_wb = label_wb
+        self.device_wb = device_wb
+        self.pad_left = device_pad_left(label_wb, device_wb, align, left_shift_dots)
+        self.buf = bytearray(device_wb * rows)
+        self.view = memoryview(self.buf)
+
+    def pack_image(self, img: Optional[Image.Image], rotate_180: bool = False, dy: int = 0,
+                   threshold: int = THRESHOLD, invert: bool = INVERT_BW,
+                   row0: int = 0, src_row0: int = 0, total_rows: Optional[int] = None) -> "DeviceRaster":
+        """
+        img, tam etiketin [src_row0, src_row0 + img.height) kaynak satırlarıdır; tampon ise cihaz
+        raster'ının row0'dan başlayan satırlarını tutar (bant gönderimi için). total_rows: etiketin
+        tam yüksekliği (döndürme hesabı). Varsayılanlarla tüm etiket tek tampona yazılır.
+        """
+        # 180°: satırlar ve satır içi baytlar ters sırayla okunur, bitler zaten ters paketlenmiştir
+        total = self.rows if total_rows is None else total_rows
+        n_src = img.height if img is not None else 0
+        if img is not None:
+            assert img.width == self.label_wb * 8
+            src = memoryview(pack_1bit(img, threshold=threshold, invert=invert, reverse_bits=rotate_180))
+        wb, dwb = self.label_wb, self.device_wb
+        white = (b"\xff" * wb) if invert else None
+        dst = self.pad_left
+        for r in range(row0, row0 + self.rows):
+            k = r - dy
+            s = (total - 1 - k) if rotate_180 else k
+            if 0 <= k < total and src_row0 <= s < src_row0 + n_src:
+                off = (s - src_row0) * wb
+                if rotate_180:
+                    self.view[dst:dst + wb] = src[off:off + wb][::-1]
+                else:
+                    self.view[dst:dst + wb] = src[off:off + wb]
+            elif white:
+                self.view[dst:dst + wb] = white
+            dst += dwb
+        return self
+
+    def white_row(self, invert: bool = INVERT_BW) -> bytes:
+        # Beyaz (mürekkepsiz) bir satırın cihazdaki bayt hali: dolgu 0x00, etiket bölgesi ters modda 0xFF
+        fill = b"\xff" if invert else b"\x00"
+        right = self.device_wb - self.pad_left - self.label_wb
+        return bytes(self.pad_left) + fill * self.label_wb + bytes(right)
+
+    def label_image(self, invert: bool = INVERT_BW) -> Image.Image:
+        # Önizleme: yazıcıya giden raster'ın etiket bölgesi, birebir "1" görüntü olarak
+        full = Image.frombytes("1", (self.device_wb * 8, self.rows), self.buf, "raw", "1" if invert else "1;I")
+        x0 = self.pad_left * 8
+        return full.crop((x0, 0, x0 + self.label_wb * 8, self.rows))
+
+def iter_device_bands(img: Image.Image, band_rows: int, rotate_180: bool = False, dy: int = 0,
+                      device_wb: int = DEVICE_WIDTH_BYTES, align: str = "center", left_shift_dots: int = 0):
+    # Cihaz raster'ını yukarıdan aşağı band_rows yüksekliğinde bantlar halinde üretir;
+    # her bant yalnızca kendi kaynak satırlarını kırpıp paketler (tam raster beklemeden).
+    total = img.height
+    label_wb = img.width // 8
+    for r0 in range(0, total, band_rows):
+        r1 = min(total, r0 + band_rows)
+        k0, k1 = max(0, r0 - dy), min(total, r1 - dy)
+        part, s0 = None, 0
+        if k0 < k1:
+            s0, s1 = ((total - k1, total - k0) if rotate_180 else (k0, k1))
+            part = img.crop((0, s0, img.width, s1))
+        yield DeviceRaster(r1 - r0, label_wb, device_wb=device_wb, align=align, left_shift_dots=left_shift_dots) \
+            .pack_image(part, rotate_180=rotate_180, dy=dy, row0=r0, src_row0=s0, total_rows=total)
+
+# -------- Gerçek zamanlı durum (DLE EOT) --------
+class PrinterNotReady(RuntimeError):
+    """Yazıcı kağıt bitti / kapak açık / hata durumunda ya da hazır olmayı beklerken zaman aşımında."""
+
+# Yanıt vermeyen yazıcıda her baskıda zaman aşımı ödenmesin: port nesnesi başına destek bilgisi
+_STATUS_SUPPORT: "weakref.WeakKeyDictionary[serial.Serial, bool]" = weakref.WeakKeyDictionary()
+# GS ( H desteği bağlantıda bir kez yoklanır (probe_job_completion); bilinmeyen port için kullanılmaz
+_JOB_ID_SUPPORT: "weakref.WeakKeyDictionary[serial.Serial, bool]" = weakref.WeakKeyDictionary()
+_JOB_ID_SEQ = [0]
+_JOB_ID_LOCK = threading.Lock()  # iş ve terazi iş parçacıkları aynı kimliği almasın
+
+def _drain_input(ser: serial.Serial):
+    # Bekleyen yanıtları bloklamadan at (read(64) port zaman aşımı kadar bekler)
+    try:
+        n = ser.in_waiting
+        if n:
+            ser.read(n)
+    except Exception:
+        pass
+
+def query_status_byte(ser: serial.Serial, n: int, timeout: float = PRN_STATUS_TIMEOUT) -> Optional[int]:
+    # DLE EOT n: yazıcı komut kuyruğunu beklemeden tek bayt döner. Geçerli durum baytı: 0xx1xx10
+    _drain_input(ser)
+    old_timeout = ser.timeout
+    try:
+        ser.timeout = timeout
+        ser.write(bytes([0x10, 0x04, n])); ser.flush()
+        resp = ser.read(1)
+    finally:
+        ser.timeout = old_timeout
+    if len(resp) != 1 or (resp[0] & 0x93) != 0x12:
+        return None
+    return resp[0]
+
+def read_printer_status(ser: serial.Serial, timeout: float = PRN_STATUS_TIMEOUT) -> Optional[Dict[str, bool]]:
+    """
+    DLE EOT 1 (yazıcı), 2 (çevrimdışı nedeni), 4 (kağıt sensörü) ile durumu okur.
+    Yazıcı yanıt vermiyorsa None döner ve bu port için bir daha sorgulanmaz.
+    """
+    if _STATUS_SUPPORT.get(ser) is False:
+        return None
+    try:
+        prn = query_status_byte(ser, 1, timeout)
+        if prn is None:
+            _STATUS_SUPPORT[ser] = False
+            return None
+        _STATUS_SUPPORT[ser] = True
+        off = query_status_byte(ser, 2, timeout) or 0x12
+        paper = query_status_byte(ser, 4, timeout) or 0x12
+    except Exception:
+        return None
+    offline = bool(prn & 0x08)
+    cover_open = bool(off & 0x04)
+    paper_out = bool(paper & 0x60) or bool(off & 0x20)
+    error = bool(off & 0x40)
+    return {
+        "online": not offline,
+        "busy": offline and not (cover_open or paper_out or error),   # besleme/baskı sürerken çevrimdışı
+        "cover_open": cover_open,
+        "paper_out": paper_out,
+        "paper_near_end": bool(paper & 0x0C),
+        "error": error,
+        "ready": not (offline or cover_open or paper_out or error),
+    }
+
+def describe_printer_status(st: Dict[str, bool]) -> str:
+    if st["paper_out"]: return "Kağıt bitti"
+    if st["cover_open"]: return "Kafa/kapak açık"
+    if st["error"]: return "Yazıcı hatası"
+    if st["busy"]: return "Yazıcı meşgul"
+    return "Hazır"
+
+def wait_printer_ready(ser: serial.Serial, timeout: float = PRN_READY_TIMEOUT,
+                       poll: float = 0.02) -> Optional[Dict[str, bool]]:
+    """
+    Yazıcı hazır olana kadar durumu yoklar ve hazır olduğu anda döner.
+    Kağıt bitti / kapak açık / hata hemen PrinterNotReady olarak bildirilir; meşgul durumu timeout'a kadar beklenir.
+    DLE EOT gerçek zamanlı işlendiğinden "hazır" yalnız yazıcının çevrimiçi ve hatasız olduğunu gösterir,
+    tampondaki etiketin basılıp bittiğini göstermez (bunun için wait_job_complete).
+    Yazıcı durum sorgusunu desteklemiyorsa None döner (çağıran sabit beklemeye düşer).
+    """
+    end = time.time() + timeout
+    while True:
+        st = read_printer_status(ser)
+        if st is None:
+            return None
+        if st["ready"]:
+            return st
+        if not st["busy"]:
+            raise PrinterNotReady(describe_printer_status(st))
+        if time.time() >= end:
+            raise PrinterNotReady("Yazıcı hazır olmadı (meşgul)")
+        time.sleep(poll)
+
+def _job_id_command(job_id: bytes) -> bytes:
+    # GS ( H fn 48: kendinden önceki veriler işlenip basılınca 37h 22h d1..d4 00h döner
+    return b"\x1d\x28\x48\x06\x00\x30\x30" + job_id
+
+def _read_job_id_response(ser: serial.Serial, job_id: bytes, timeout: float) -> bool:
+    expected = b"\x37\x22" + job_id + b"\x00"
+    buf = b""
+    old_timeout = ser.timeout
+    end = time.monotonic() + timeout
+    try:
+        while True:
+            left = end - time.monotonic()
+            if left <= 0:
+                return False
+            ser.timeout = min(left, 0.1)
+            buf += ser.read(ser.in_waiting or 1)
+            if expected in buf:
+                return True
+            buf = buf[-(len(expected) - 1):]  # araya giren durum baytları atılır
+    finally:
+        ser.timeout = old_timeout
+
+def probe_job_completion(ser: serial.Serial, timeout: float = 0.5) -> bool:
+    # Boştaki yazıcı GS ( H'ye hemen yanıt verir; vermiyorsa bu port için baskı bitişi beklenmez
+    _drain_input(ser)
+    try:
+        ser.write(_job_id_command(b"0000")); ser.flush()
+        ok = _read_job_id_response(ser, b"0000", timeout)
+    except Exception:
+        ok = False
+    _JOB_ID_SUPPORT[ser] = ok
+    return ok
+
+def wait_job_complete(ser: serial.Serial, timeout: float = PRN_JOB_TIMEOUT) -> Optional[bool]:
+    """
+    Gönderilen etiketler gerçekten basılıp bitti mi: GS ( H yanıtını bekler. Desteklenmiyorsa None.
+    Yanıt gelmezse (kağıt bitti, kapak açıldı...) durum okunup PrinterNotReady yükseltilir.
+    """
+    if not _JOB_ID_SUPPORT.get(ser):
+        return None
+    with _JOB_ID_LOCK:
+        _JOB_ID_SEQ[0] = (_JOB_ID_SEQ[0] + 1) % 10000
+        job_id = f"{_JOB_ID_SEQ[0]:04d}".encode()
+    _drain_input(ser)
+    ser.write(_job_id_command(job_id)); ser.flush()
+    if _read_job_id_response(ser, job_id, timeout):
+        return True
+    st = read_printer_status(ser)
+    if st is not None and not st["ready"]:
+        raise PrinterNotReady(describe_printer_status(st))
+    raise PrinterNotReady("Baskı tamamlanma yanıtı gelmedi")
+
+def settle_printer(ser: serial.Serial, fallback_sleep: float):
+    # Etiketler arası: yalnız DLE EOT ile çevrimiçi/hatasız olduğu doğrulanır (baskının bittiğini göstermez);
+    # durum sorgusu yoksa eski sabit bekleme. Baskı bitişi kopya grubunun sonunda finish_print_job ile beklenir.
+    if wait_printer_ready(ser) is None and fallback_sleep > 0:
+        time.sleep(fallback_sleep)
+
+def finish_print_job(ser: serial.Serial) -> Optional[bool]:
+    """
+    Bir seri/kopya grubunun sonunda bir kez çağrılır: yazıcı destekliyorsa (GS ( H) gönderilen tüm etiketler
+    basılana kadar bekler ve True döner; desteklemiyorsa None. Basılamadıysa PrinterNotReady.
+    """
+    done = wait_job_complete(ser)
+    if done:
+        wait_printer_ready(ser)
+    return done
+
+# -------- Baud hızı müzakeresi --------
+def printer_device_key(port: str) -> str:
+    # USB yazıcılar yeniden takılınca farklı düğüme düşebilir; mümkünse VID:PID:seri no ile anahtarla
+    try:
+        for p in list_ports.comports():
+            if p.device == port and p.vid is not None:
+                return f"{p.vid:04x}:{p.pid:04x}:{p.serial_number or port}"
+    except Exception:
+        pass
+    return port
+
+def load_saved_printer_baud(port: str) -> Optional[int]:
+    try:
+        with open(PRN_BAUD_CACHE_PATH, "r", encoding="utf-8") as f:
+            v = json.load(f).get(printer_device_key(port))
+        return int(v) if v else None
+    except Exception:
+        return None
+
+def save_printer_baud(port: str, baud: int):
+    try:
+        try:
+            with open(PRN_BAUD_CACHE_PATH, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            data = {}
+        data[printer_device_key(port)] = int(baud)
+        with open(PRN_BAUD_CACHE_PATH, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+    except Exception:
+        pass
+
+def open_printer_port(port: str, baud: int) -> serial.Serial:
+    return serial.Serial(
+        port=port, baudrate=baud, bytesize=serial.EIGHTBITS,
+        parity=PRN_PARITY, stopbits=serial.STOPBITS_ONE, timeout=PRN_TIMEOUT,
+        rtscts=(PRN_FLOW == "rtscts"), xonxoff=(PRN_FLOW == "xonxoff"),
+        write_timeout=PRN_WRITE_TIMEOUT,
+    )
+
+def printer_answers(ser: serial.Serial, attempts: int = 3) -> bool:
+    # Durum baytı geri geliyorsa bu hızda iki yönlü iletişim doğrudur
+    for _ in range(attempts):
+        try:
+            if query_status_byte(ser, 1) is not None:
+                return True
+        except Exception:
+            return False
+    return False
+
+def _set_interface_baud_commands(baud: int) -> bytes:
+    # GS ( E: kullanıcı ayar moduna gir (fn 1), seri hız (fn 11, a=1, ASCII ondalık), çık ve sıfırla (fn 2)
+    digits = str(baud).encode("ascii")
+    fn11 = bytes([0x0B, 0x01]) + digits
+    return (b"\x1d\x28\x45\x03\x00\x01\x49\x4e"
+            + b"\x1d\x28\x45" + bytes([len(fn11) & 0xFF, len(fn11) >> 8]) + fn11
+            + b"\x1d\x28\x45\x04\x00\x02\x4f\x55\x54")
+
+def _reopen_and_verify(port: str, baud: int, wait: float = 3.0) -> Optional[serial.Serial]:
+    # Yazıcı hız değişiminden sonra yeniden başlar; hazır olana kadar bu hızda yokla
+    end = time.time() + wait
+    while time.time() < end:
+        try:
+            ser = open_printer_port(port, baud)
+        except Exception:
+            time.sleep(0.2); continue
+        if printer_answers(ser, attempts=1):
+            return ser
+        ser.close()
+        time.sleep(0.2)
+    return None
+
+def negotiate_printer_baud(port: str, probe: bool = PRN_BAUD_PROBE,
+                           candidates: Tuple[int, ...] = PRN_BAUD_CANDIDATES) -> Tuple[serial.Serial, str]:
+    """
+    Yazıcı portunu en yüksek doğrulanmış hızla açar: (port, açıklama) döner.
+    Sıra: kayıtlı hız -> PRN_BAUD. probe açıksa (ve cihaz için kayıt yoksa) yüksek hızlar sırayla denenir; her biri
+    GS ( E ile yazıcıya ayarlatılır ve DLE EOT durum gidiş-dönüşüyle doğrulanır, kazanan cihaz başına kaydedilir.
+    Yazıcı durum sorgusuna yanıt vermiyorsa doğrulama yapılamaz ve PRN_BAUD ile açılır.
+    """
+    saved = load_saved_printer_baud(port)
+    if saved:
+        # Daha önce müzakere edilmiş cihaz yeniden denenmez (yeniden denemek için kayıt dosyasını sil)
+        ser = open_printer_port(port, saved)
+        if printer_answers(ser):
+            return ser, f"{saved} (kayıtlı)"
+        ser.close()
+
+    ser = open_printer_port(port, PRN_BAUD)
+    if not printer_answers(ser):
+        return ser, f"{PRN_BAUD} (doğrulanamadı)"
+    if not probe:
+        return ser, f"{PRN_BAUD}"
+
+    current = PRN_BAUD
+    for baud in sorted((b for b in candidates if b > PRN_BAUD), reverse=True):
+        ser.write(_set_interface_baud_commands(baud)); ser.flush()
+        ser.close()
+        nser = _reopen_and_verify(port, baud)
+        if nser is not None:
+            save_printer_baud(port, baud)
+            return nser, f"{baud} (müzakere edildi)"
+        # Yazıcı hızı değiştirmediyse ya da değiştirip yanıt vermiyorsa eski hıza dön
+        ser = _reopen_and_verify(port, current, wait=1.0)
+        if ser is None:
+            for b in (PRN_BAUD,) + tuple(candidates):
+                ser = _reopen_and_verify(port, b, wait=0.5)
+                if ser is not None:
+                    current = b
+                    break
+        if ser is None:
+            ser = open_printer_port(port, PRN_BAUD)
+            return ser, f"{PRN_BAUD} (yazıcı yanıt vermiyor)"
+    save_printer_baud(port, current)
+    return ser, f"{current}"
 
 # -------- Yazıcı protokolü --------
 def printer_handshake(ser: serial.Serial):
@@ -652,25 +1687,430 @@ def printer_handshake(ser: serial.Serial):
     for cmd in seq:
         ser.write(cmd); ser.flush()
         time.sleep(0.06)
-        try: _ = ser.read(64)
-        except Exception: pass
+        _drain_input(ser)
 
 def clear_printer_buffer(ser: serial.Serial):
     try:
-        ser.write(b"\x18"); ser.flush(); time.sleep(0.03); _ = ser.read(64)
+        ser.write(b"\x18"); ser.flush()
+        settle_printer(ser, 0.03)
+        _drain_input(ser)
+    except PrinterNotReady:
+        raise
     except Exception:
         pass
 
-def send_single_esc_v_height_only(ser: serial.Serial, raw_padded: bytes, rows: int, chunk_size: int = DATA_CHUNK_SIZE):
-    nL, nH = rows & 0xFF, (rows >> 8) & 0xFF
-    header = bytes([0x1B, 0x56, nL, nH])
-    ser.write(header); ser.flush(); time.sleep(0.01)
-    total = len(raw_padded); sent = 0
-    while sent < total:
-        end = min(sent + chunk_size, total)
-        ser.write(raw_padded[sent:end]); ser.flush()
-        sent = end; time.sleep(0.002)
-    time.sleep(0.05)
+# -------- İndirme grafiği (kopyaların referansla basılması) --------
+def query_download_graphics_capacity(ser: serial.Serial, timeout: float = 0.3) -> Optional[int]:
+    # GS ( L fn 52: indirme grafik belleğinin kalan kapasitesi. Yanıt: 37h <id> <ASCII ondalık> 00h
+    try:
+        ser.reset_input_buffer()
+        ser.write(b"\x1d\x28\x4c\x02\x00\x30\x34"); ser.flush()
+        resp = b""
+        end = time.time() + timeout
+        while time.time() < end and not resp.endswith(b"\x00"):
+            chunk = ser.read(ser.in_waiting or 1)
+            if chunk:
+                resp += chunk
+        i = resp.find(b"\x37")
+        digits = resp[i + 2:].split(b"\x00", 1)[0] if i >= 0 else b""
+        return int(digits) if digits.isdigit() else None
+    except Exception:
+        return None
+
+def define_download_graphics(ser: serial.Serial, raster, width_dots: int, rows: int,
+                             key: bytes = DOWNLOAD_GRAPHICS_KEY) -> int:
+    # Önce aynı anahtarlı eski grafiği sil (GS ( L fn 82), sonra GS 8 L fn 83 ile raster olarak tanımla
+    # Veri raster yoluyla aynı PrinterWriter'dan geçer: akış kontrolü yoksa parça başı flush + bekleme
+    data = memoryview(raster)
+    w = PrinterWriter(ser)
+    w.write(b"\x1d\x28\x4c\x04\x00\x30\x52" + key)
+    w.settle(0.01)
+    p = 11 + len(data)
+    header = bytes([0x1D, 0x38, 0x4C, p & 0xFF, (p >> 8) & 0xFF, (p >> 16) & 0xFF, (p >> 24) & 0xFF,
+                    0x30, 0x53, 0x30]) + key + bytes([
+                    0x01, width_dots & 0xFF, (width_dots >> 8) & 0xFF, rows & 0xFF, (rows >> 8) & 0xFF, 0x31])
+    w.write(header)
+    w.write(data)
+    w.drain()
+    return w.bytes
+
+def print_download_graphics(ser: serial.Serial, key: bytes = DOWNLOAD_GRAPHICS_KEY, feed_after_lines: int = 0):
+    # GS ( L fn 85: indirilmiş grafiği 1x1 ölçekle bas
+    ser.write(b"\x1d\x28\x4c\x06\x00\x30\x55" + key + b"\x01\x01")
+    if feed_after_lines > 0:
+        ser.write(b"\n" * feed_after_lines)
+    ser.flush()
+    settle_printer(ser, 0.2)
+
+class PrinterWriter:
+    """
+    Yazıcıya raster yazar ve elde edilen hızı ölçer.
+    Akış kontrolü (PRN_FLOW) varsa parçalar flush/bekleme olmadan art arda yazılır: işletim sisteminin
+    gönderme tamponu dolu kalır, yazıcı yetişemezse CTS/XOFF ile kendisi durdurur. Tek flush drain()'de.
+    Akış kontrolü yoksa yazıcının taşmaması için eski parça başı flush + kısa bekleme korunur.
+    """
+    def __init__(self, ser: serial.Serial, flow: Optional[str] = None, chunk_size: int = DATA_CHUNK_SIZE):
+        self.ser = ser
+        self.flow = PRN_FLOW if flow is None else flow
+        self.paced = self.flow not in ("rtscts", "xonxoff", "usb")
+        self.chunk_size = chunk_size
+        self.bytes = 0
+        self.elapsed = 0.0
+        self._t0: Optional[float] = None
+
+    def write(self, data) -> int:
+        data = memoryview(data)
+        if self._t0 is None:
+            self._t0 = time.perf_counter()
+        for off in range(0, len(data), self.chunk_size):
+            self.ser.write(data[off:off + self.chunk_size])
+            if self.paced:
+                self.ser.flush(); time.sleep(0.002)
+        self.bytes += len(data)
+        return len(data)
+
+    def settle(self, seconds: float):
+        # Yalnız akış kontrolsüz bağlantıda beklenir; aksi halde yazıcı kendisi durdurur
+        if self.paced and seconds > 0:
+            time.sleep(seconds)
+
+    def drain(self):
+        self.ser.flush()
+        if self._t0 is not None:
+            self.elapsed += time.perf_counter() - self._t0
+            self._t0 = None
+
+    def throughput(self) -> Dict[str, Any]:
+        # 8N1: bayt başına 10 bit -> teorik üst sınır baud/10 bayt/sn
+        baud = getattr(self.ser, "baudrate", 0) or 0
+        limit = baud / 10.0
+        bps = self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+        return {"flow": self.flow, "paced": self.paced, "bytes_per_sec": int(bps), "limit_bytes_per_sec": int(limit),
+                "efficiency": round(bps / limit, 3) if limit else 0.0}
+
+def raster_bands(view, row_bytes: int, rows: int, min_blank_rows: int = BLANK_RUN_MIN_ROWS,
+                 blank_row: Optional[bytes] = None) -> List[Tuple[int, int, bool]]:
+    """
+    Raster'ı (başlangıç, bitiş, boş_mu) satır aralıklarına böler. blank_row'a (varsayılan: tümü 0x00,
+    ters modda DeviceRaster.white_row()) eşit satırlar boştur;
+    min_blank_rows'tan kısa boş koşular, başlık maliyetine değmediği için mürekkepli banda katılır.
+    """
+    view = memoryview(view)
+    zero_row = bytes(row_bytes) if blank_row is None else blank_row
+    bands: List[Tuple[int, int, bool]] = []
+    start = 0
+    cur_blank = None
+    for r in range(rows):
+        off = r * row_bytes
+        blank = view[off:off + row_bytes] == zero_row
+        if cur_blank is None:
+            cur_blank = blank
+        elif blank != cur_blank:
+            bands.append((start, r, cur_blank))
+            start, cur_blank = r, blank
+    if rows:
+        bands.append((start, rows, bool(cur_blank)))
+
+    merged: List[Tuple[int, int, bool]] = []
+    for b0, b1, blank in bands:
+        if blank and (b1 - b0) < min_blank_rows:
+            blank = False
+        if merged and merged[-1][2] == blank:
+            merged[-1] = (merged[-1][0], b1, blank)
+        else:
+            merged.append((b0, b1, blank))
+    return merged
+
+def feed_dots_command(dots: int) -> bytes:
+    # ESC J n: n nokta kağıt besle (n <= 255)
+    out = bytearray()
+    while dots > 0:
+        n = min(255, dots)
+        out += bytes([0x1B, 0x4A, n])
+        dots -= n
+    return bytes(out)
+
+def _write_esc_v_bands(w: PrinterWriter, view: memoryview, row_bytes: int, bands: List[Tuple[int, int, bool]]) -> int:
+    # Her mürekkepli bant kendi ESC V başlığıyla, boş koşular ESC J beslemesiyle yazılır
+    sent_bytes = 0
+    for b0, b1, blank in bands:
+        if blank:
+            sent_bytes += w.write(feed_dots_command(b1 - b0))
+            continue
+        n = b1 - b0
+        sent_bytes += w.write(bytes([0x1B, 0x56, n & 0xFF, (n >> 8) & 0xFF]))
+        w.settle(0.01)
+        sent_bytes += w.write(view[b0 * row_bytes:b1 * row_bytes])
+    return sent_bytes
+
+def send_single_esc_v_height_only(ser: serial.Serial, raw_padded, rows: int, chunk_size: int = DATA_CHUNK_SIZE,
+                                  skip_blank: Optional[bool] = None, blank_row: Optional[bytes] = None) -> Dict[str, Any]:
+    # raw_padded: bytes ya da memoryview; parçalar dilimlenerek (kopyasız) yazılır
+    raw_padded = memoryview(raw_padded)
+    if skip_blank is None:
+        skip_blank = SKIP_BLANK_ROWS
+    total = len(raw_padded)
+    row_bytes = total // rows if rows else 0
+    full_bytes = 4 + total
+    if skip_blank and row_bytes:
+        bands = raster_bands(raw_padded, row_bytes, rows, blank_row=blank_row)
+    else:
+        bands = [(0, rows, False)]
+    w = PrinterWriter(ser, chunk_size=chunk_size)
+    sent_bytes = _write_esc_v_bands(w, raw_padded, row_bytes, bands)
+    w.drain()
+    w.settle(0.05)
+    return {"bytes": sent_bytes, "full_bytes": full_bytes, "saved": full_bytes - sent_bytes, "bands": len(bands),
+            **w.throughput()}
+
+def send_esc_v_streamed(ser: serial.Serial, bands, chunk_size: int = DATA_CHUNK_SIZE,
+                        skip_blank: Optional[bool] = None, on_band=None) -> Dict[str, Any]:
+    """
+    DeviceRaster bantlarını (iter_device_bands) her biri kendi ESC V komutuyla gönderir.
+    Gönderim ayrı bir iş parçacığında yapılır; bant N yazılırken bant N+1 paketlenir,
+    böylece kafa ilk bant gelince basmaya başlar. on_band(band, row0) gönderilen her bant için çağrılır.
+    """
+    if skip_blank is None:
+        skip_blank = SKIP_BLANK_ROWS
+    q: "queue.Queue[Optional[Tuple[int, DeviceRaster]]]" = queue.Queue(maxsize=2)
+    stats: Dict[str, Any] = {"bytes": 0, "full_bytes": 4, "saved": 0, "bands": 0}
+    errors: List[BaseException] = []
+    w = PrinterWriter(ser, chunk_size=chunk_size)
+
+    def writer():
+        while True:
+            item = q.get()
+            if item is None:
+                return
+            if errors:
+                continue
+            row0, band = item
+            try:
+                row_bytes = band.device_wb
+                sub = (raster_bands(band.view, row_bytes, band.rows, blank_row=band.white_row())
+                       if skip_blank else [(0, band.rows, False)])
+                stats["bytes"] += _write_esc_v_bands(w, band.view, row_bytes, sub)
+                stats["full_bytes"] += len(band.buf)
+                stats["bands"] += len(sub)
+                if callable(on_band):
+                    on_band(band, row0)
+            except BaseException as e:
+                errors.append(e)
+
+    t = threading.Thread(target=writer, name="RasterWriter", daemon=True)
+    t.start()
+    try:
+        row0 = 0
+        for band in bands:
+            if errors:
+                break
+            q.put((row0, band))
+            row0 += band.rows
+    finally:
+        q.put(None)
+        t.join()
+    if errors:
+        raise errors[0]
+    w.drain()
+    w.settle(0.05)
+    stats["saved"] = stats["full_bytes"] - stats["bytes"]
+    stats.update(w.throughput())
+    return stats
+
+# -------- Raster önbelleği --------
+class RasterCache:
+    """
+    Anahtar -> hazır (döndürülmüş, paketlenmiş, dolgulu) cihaz raster'ı. Toplam bayt max_bytes'ı
+    aşınca en eski kullanılan kayıt atılır. İş ve terazi iş parçacıklarından birlikte kullanılır.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._data.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._data[key] = data
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes:
+                _, ev = self._data.popitem(last=False)
+                self.bytes -= len(ev)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._data),
+                    "bytes": self.bytes, "max_bytes": self.max_bytes, "evictions": self.evictions,
+                    "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+RASTER_CACHE = RasterCache(RASTER_CACHE_BYTES)
+# Hibrit sayfa komutları ayrı tutulur: raster önbelleğinin isabet oranını bozmasın
+HYBRID_PAGE_CACHE = RasterCache(RASTER_CACHE_BYTES // 4)
+TEMPLATE_CACHE = RasterCache(TEMPLATE_CACHE_BYTES)
+
+def label_cache_key(payload: Dict[str, Any], inner_dx_mm: float, inner_dy_mm: float, debug_frame: bool) -> str:
+    # Raster'ı etkileyen her şey: payload içeriği + iç/fiziksel kaydırmalar + eşik/döndürme/çizim ayarları
+    doc = {
+        "payload": payload,
+        "inner": [inner_dx_mm, inner_dy_mm],
+        "phys": [PHYS_SHIFT_DOWN_MM, H_SHIFT_MM],
+        "render": [THRESHOLD, INVERT_BW, ROTATE_180, RENDER_MODE, PRODUCT_TITLE_WRAP, bool(debug_frame)],
+        "geom": [WIDTH_DOTS, HEIGHT_DOTS, BOTTOM_FORBID, DEVICE_WIDTH_BYTES],
+    }
+    blob = json.dumps(doc, sort_keys=True, ensure_ascii=False, default=str, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def _merge_rows(raster: DeviceRaster, band: DeviceRaster, row0: int, invert: bool = INVERT_BW):
+    # Mürekkep 1 ise OR, ters (INVERT_BW) rasterde mürekkep 0 olduğundan AND
+    a, b = row0 * raster.device_wb, (row0 + band.rows) * raster.device_wb
+    x = int.from_bytes(raster.view[a:b], "big")
+    y = int.from_bytes(band.view, "big")
+    raster.view[a:b] = ((x & y) if invert else (x | y)).to_bytes(b - a, "big")
+
+def pack_label_layered(raster: DeviceRaster, payload: Dict[str, Any], inner_dx_mm: float, inner_dy_mm: float,
+                       debug_frame: bool, dy: int) -> bool:
+    """
+    raster'ı statik katman + değişken bant olarak doldurur; statik katman önbellekteyse True döner.
+    Statik katman VARIABLE_FIELDS dışındaki payload + ayarlarla anahtarlanır ve dönmüş/dolgulu cihaz
+    raster'ı olarak saklanır. Değişken katmanın yalnız mürekkep içeren satırları paketlenip bindirilir.
+    """
+    kw = dict(inner_dx_dots=mm_to_dots(inner_dx_mm), inner_dy_dots=mm_to_dots(inner_dy_mm),
+              debug_frame=debug_frame, rotate_180=False)
+    static_payload = {k: v for k, v in payload.items() if k not in VARIABLE_FIELDS}
+    key = label_cache_key(static_payload, inner_dx_mm, inner_dy_mm, debug_frame)
+    static = TEMPLATE_CACHE.get(key)
+    hit = static is not None
+    if static is None:
+        img = compose_label(payload, WIDTH_DOTS, HEIGHT_DOTS, BOTTOM_FORBID, layer="static", **kw)
+        raster.pack_image(img, rotate_180=ROTATE_180, dy=dy, invert=INVERT_BW)
+        TEMPLATE_CACHE.put(key, bytes(raster.buf))
+    else:
+        raster.view[:] = static
+
+    var = compose_label(payload, WIDTH_DOTS, HEIGHT_DOTS, BOTTOM_FORBID, layer="variable", **kw)
+    bbox = ImageChops.invert(var.convert("L")).getbbox()
+    if not bbox:
+        return hit
+    s0, s1 = bbox[1], bbox[3]
+    total = HEIGHT_DOTS
+    r0, r1 = ((total - s1 + dy, total - s0 + dy) if ROTATE_180 else (s0 + dy, s1 + dy))
+    r0, r1 = max(0, r0), min(raster.rows, r1)
+    if r0 >= r1:
+        return hit
+    band = DeviceRaster(r1 - r0, raster.label_wb, device_wb=raster.device_wb)
+    band.pad_left = raster.pad_left  # ana raster ile aynı yatay konum
+    band.pack_image(var.crop((0, s0, var.width, s1)), rotate_180=ROTATE_180, dy=dy,
+                    row0=r0, src_row0=s0, total_rows=total, invert=INVERT_BW)
+    _merge_rows(raster, band, r0, invert=INVERT_BW)
+    return hit
+
+# -------- Hibrit çıktı (yerel barkod + sayfa modu) --------
+def ink_byte_span(view, row_bytes: int, r0: int, r1: int) -> Tuple[int, int]:
+    # Banttaki satırların OR'u: ilk ve son mürekkepli bayt sütunu [sol, sağ)
+    acc = 0
+    for r in range(r0, r1):
+        off = r * row_bytes
+        acc |= int.from_bytes(view[off:off + row_bytes], "big")
+    if not acc:
+        return 0, 0
+    total_bits = row_bytes * 8
+    left = (total_bits - acc.bit_length()) // 8
+    right = row_bytes - (((acc & -acc).bit_length() - 1) // 8)
+    return left, right
+
+def page_position_command(x: int, y: int) -> bytes:
+    # ESC $ (mutlak yatay) + GS $ (sayfa modunda mutlak dikey)
+    return bytes([0x1B, 0x24, x & 0xFF, (x >> 8) & 0xFF, 0x1D, 0x24, y & 0xFF, (y >> 8) & 0xFF])
+
+GRAPHICS_PRINT_COMMAND = b"\x1d\x28\x4c\x02\x00\x30\x32"  # GS ( L fn 50: saklanan grafiği bas
+
+def page_graphics_command(width_dots: int, rows: int, data) -> bytes:
+    # GS ( L / GS 8 L fn 112 grafiği yalnız yazıcının grafik tamponuna saklar (sonraki fn 112 üzerine yazar);
+    # ardından fn 50 ile basılır, sayfa modunda geçerli konumda sayfa alanına işlenir
+    params = bytes([0x30, 0x70, 0x30, 0x01, 0x01, 0x31,
+                    width_dots & 0xFF, (width_dots >> 8) & 0xFF, rows & 0xFF, (rows >> 8) & 0xFF])
+    p = len(params) + len(data)
+    if p <= 0xFFFF:
+        head = b"\x1d\x28\x4c" + bytes([p & 0xFF, p >> 8])
+    else:
+        head = b"\x1d\x38\x4c" + p.to_bytes(4, "little")
+    return head + params + bytes(data) + GRAPHICS_PRINT_COMMAND
+
+def build_hybrid_page(payload: Dict[str, Any], inner_dx_mm: float, inner_dy_mm: float, debug_frame: bool,
+                      pad_left: int, img: Optional[Image.Image] = None) -> Optional[Tuple[bytes, int]]:
+    """
+    Etiketi sayfa modu komut dizisi olarak üretir: (komutlar, grafik bandı sayısı); uygun değilse None.
+    Çubuklar GS k ile, okunur rakamlar ve diğer her şey raster olarak aynı konumlara basılır.
+    img verilirse (native_barcode=True, döndürülmemiş çizim) yeniden çizilmez.
+    180° döndürme yazıcıya bırakılır (ESC T 2); konumlar döndürülmemiş etiket koordinatlarıdır.
+    Sayfa modunda grafik ve barkod alt kenarları geçerli dikey konuma gelecek şekilde yerleşir.
+    """
+    digits = ean13_digits(str(payload.get("barcode", "")))
+    if not digits or INVERT_BW:
+        return None
+    inner_dx, inner_dy = mm_to_dots(inner_dx_mm), mm_to_dots(inner_dy_mm)
+    rx, rw, bar_top, box_h = barcode_box(WIDTH_DOTS, inner_dx, inner_dy)
+    x0, mw, bar_h = ean13_geometry(rw, box_h)
+    if not 2 <= mw <= 6 or bar_h + 1 > 255:
+        return None  # GS w / GS h aralığı dışında: tam raster
+
+    if img is None:
+        img = compose_label(payload, WIDTH_DOTS, HEIGHT_DOTS, BOTTOM_FORBID, inner_dx_dots=inner_dx,
+                            inner_dy_dots=inner_dy, debug_frame=debug_frame, rotate_180=False, native_barcode=True)
+    packed = memoryview(pack_1bit(img, threshold=THRESHOLD, invert=False))
+    wb, total = LABEL_WIDTH_BYTES, HEIGHT_DOTS
+    y_off = mm_to_dots(PHYS_SHIFT_DOWN_MM)
+    x_off = (DEVICE_WIDTH_DOTS - wb * 8 - pad_left * 8) if ROTATE_180 else pad_left * 8
+    if not (0 <= bar_top + y_off and bar_top + bar_h + y_off < total):
+        return None
+
+    out = bytearray(b"\x1bL")
+    out += bytes([0x1B, 0x57, 0, 0, 0, 0, DEVICE_WIDTH_DOTS & 0xFF, DEVICE_WIDTH_DOTS >> 8, total & 0xFF, total >> 8])
+    out += bytes([0x1B, 0x54, 2 if ROTATE_180 else 0])
+    n_graphics = 0
+    for b0, b1, blank in raster_bands(packed, wb, total):
+        b0, b1 = max(b0, -y_off), min(b1, total - y_off)   # fiziksel kaydırmayla sayfa dışına taşan satırlar atılır
+        if blank or b0 >= b1:
+            continue
+        left, right = ink_byte_span(packed, wb, b0, b1)
+        if left >= right:
+            continue
+        data = b"".join(packed[r * wb + left:r * wb + right] for r in range(b0, b1))
+        out += page_position_command(x_off + left * 8, b0 + y_off + (b1 - b0) - 1)
+        out += page_graphics_command((right - left) * 8, b1 - b0, data)
+        n_graphics += 1
+
+    # EAN-13: yükseklik, modül genişliği, HRI kapalı (rakamlar raster'da), konum, GS k 67 (yazıcı kontrol hanesini ekler)
+    out += bytes([0x1D, 0x68, bar_h + 1, 0x1D, 0x77, mw, 0x1D, 0x48, 0x00])
+    out += page_position_command(x_off + rx + x0, bar_top + y_off + bar_h)
+    out += bytes([0x1D, 0x6B, 0x43, 12]) + digits[:12].encode("ascii")
+    out += b"\x0c"  # FF: sayfayı bas ve standart moda dön
+    return bytes(out), n_graphics
 
 def send_label_image_to_printer(
     ser_yazici: Optional[serial.Serial],
@@ -680,48 +2120,137 @@ def send_label_image_to_printer(
     on_preview_image=None,
     inner_dx_mm: float = 0.0,
     inner_dy_mm: float = 0.0,
-    debug_frame: bool = False
+    debug_frame: bool = False,
+    store_key: Optional[bytes] = None,
+    store_capacity: int = 0
 ):
-    img = compose_label(
-        payload,
-        WIDTH_DOTS,
-        HEIGHT_DOTS,
-        BOTTOM_FORBID,
-        inner_dx_dots=mm_to_dots(inner_dx_mm),
-        inner_dy_dots=mm_to_dots(inner_dy_mm),
-        debug_frame=debug_frame
-    )
-
-    if PHYS_SHIFT_DOWN_MM != 0:
-        dy = (-mm_to_dots(PHYS_SHIFT_DOWN_MM)) if ROTATE_180 else (mm_to_dots(PHYS_SHIFT_DOWN_MM))
-        img = shift_image_vertical(img, dy=dy, fill=(255, 255, 255))
-
-    if img.size != (WIDTH_DOTS, HEIGHT_DOTS):
-        img = img.resize((WIDTH_DOTS, HEIGHT_DOTS), Image.LANCZOS)
-    raw_label, label_wb, rows = to_1bit_bytes(img, WIDTH_DOTS)
-
-    raw_padded = pad_rows_to_device_width(
-        raw_label, label_wb=label_wb, device_wb=DEVICE_WIDTH_BYTES, rows=rows,
+    """
+    store_key verilirse ve raster yazıcının indirme grafik belleğine sığıyorsa raster bir kez
+    tanımlanıp anahtarla basılır (dönüşte stats["stored"] True); sonraki kopyalar
+    print_download_graphics ile yeniden gönderim olmadan basılabilir.
+    Aynı içerik/ayarla daha önce üretilmiş raster RASTER_CACHE'ten alınır (çizim ve paketleme atlanır).
+    """
+    def render(native_barcode: bool = False) -> Image.Image:
+        return compose_label(
+            payload,
+            WIDTH_DOTS,
+            HEIGHT_DOTS,
+            BOTTOM_FORBID,
+            inner_dx_dots=mm_to_dots(inner_dx_mm),
+            inner_dy_dots=mm_to_dots(inner_dy_mm),
+            debug_frame=debug_frame,
+            rotate_180=False,
+            native_barcode=native_barcode
+        )
+
+    # Döndürme + fiziksel dikey kayma + cihaz genişliği dolgusu tek geçişte, tek tamponda
+    dy = (-mm_to_dots(PHYS_SHIFT_DOWN_MM)) if ROTATE_180 else (mm_to_dots(PHYS_SHIFT_DOWN_MM))
+    cache_key = label_cache_key(payload, inner_dx_mm, inner_dy_mm, debug_frame) if RASTER_CACHE.max_bytes > 0 else None
+    cached = RASTER_CACHE.get(cache_key) if cache_key else None
+    stream = (cached is None and STREAM_BANDS and not HYBRID_NATIVE_BARCODE and not preview_only
+              and ser_yazici is not None and not store_key)
+    if stream:
+        # Akış: tam cihaz raster'ı ayrılmaz. Önizleme yalnız istenirse gönderilen bantların etiket
+        # bölgesinden, önbellek kaydı yalnız önbellek açıksa bant baytlarından toplanır.
+        preview = Image.new("1", (LABEL_WIDTH_BYTES * 8, HEIGHT_DOTS), 1) if callable(on_preview_image) else None
+        cache_buf = bytearray() if cache_key else None
+
+        def collect(band: DeviceRaster, row0: int):
+            if preview is not None:
+                preview.paste(band.label_image(), (0, row0))
+            if cache_buf is not None:
+                cache_buf.extend(band.view)
+
+        clear_printer_buffer(ser_yazici)
+        stats = send_esc_v_streamed(
+            ser_yazici,
+            iter_device_bands(render(), STREAM_BAND_ROWS, rotate_180=ROTATE_180, dy=dy, device_wb=DEVICE_WIDTH_BYTES,
+                              align="center", left_shift_dots=mm_to_dots(H_SHIFT_MM)),
+            on_band=collect
+        )
+        if feed_after_lines > 0:
+            ser_yazici.write(b"\n" * feed_after_lines); ser_yazici.flush()
+        if cache_buf is not None:
+            RASTER_CACHE.put(cache_key, bytes(cache_buf))
+        if preview is not None:
+            try:
+                preview.save(PREVIEW_PNG_PATH)
+                preview.save(PREVIEW_BMP1_PATH, format="BMP")
+            except Exception:
+                pass
+            on_preview_image(preview)
+        settle_printer(ser_yazici, 0.2 if stats["paced"] else 0.0)
+        stats["cache_hit"] = False
+        return stats
+
+    hybrid = HYBRID_NATIVE_BARCODE and not store_key and not preview_only and ser_yazici is not None
+    page = HYBRID_PAGE_CACHE.get(cache_key) if (hybrid and cache_key) else None
+    # Hibrit sayfa gerekiyorsa etiket bir kez çubuksuz çizilir: sayfa bundan, raster/önizleme çubuklar
+    # eklenmiş kopyasından üretilir
+    native = render(native_barcode=True) if (hybrid and page is None) else None
+
+    raster = DeviceRaster(
+        HEIGHT_DOTS, LABEL_WIDTH_BYTES, device_wb=DEVICE_WIDTH_BYTES,
         align="center", left_shift_dots=mm_to_dots(H_SHIFT_MM)
     )
+    if cached is not None:
+        raster.view[:] = cached
+    elif native is not None:
+        full = native.copy()
+        rx, rw, bar_top, box_h = barcode_box(WIDTH_DOTS, mm_to_dots(inner_dx_mm), mm_to_dots(inner_dy_mm))
+        draw_ean13_bars(full, rx, bar_top, rw, box_h, str(payload.get("barcode", "")))
+        raster.pack_image(full, rotate_180=ROTATE_180, dy=dy)
+    elif TEMPLATE_CACHE.max_bytes > 0:
+        pack_label_layered(raster, payload, inner_dx_mm, inner_dy_mm, debug_frame, dy)
+    else:
+        raster.pack_image(render(), rotate_180=ROTATE_180, dy=dy)
+    if cache_key and cached is None:
+        RASTER_CACHE.put(cache_key, bytes(raster.buf))
 
+    preview = raster.label_image()
     try:
-        img.save(PREVIEW_PNG_PATH)
-        img.convert("1").save(PREVIEW_BMP1_PATH, format="BMP")
+        preview.save(PREVIEW_PNG_PATH)
+        preview.save(PREVIEW_BMP1_PATH, format="BMP")
         with open(PREVIEW_BIN_PATH, "wb") as f:
-            f.write(raw_padded)
+            f.write(raster.view)
     except Exception:
         pass
     if callable(on_preview_image):
-        on_preview_image(img)
+        on_preview_image(preview)
 
     if preview_only or ser_yazici is None:
-        return
+        return None
+    if hybrid:
+        n_graphics = 0
+        if page is None:
+            built = build_hybrid_page(payload, inner_dx_mm, inner_dy_mm, debug_frame, raster.pad_left, img=native)
+            if built is not None:
+                page, n_graphics = built
+                if cache_key:
+                    HYBRID_PAGE_CACHE.put(cache_key, page)
+        if page is not None:
+            clear_printer_buffer(ser_yazici)
+            w = PrinterWriter(ser_yazici)
+            w.write(page)
+            if feed_after_lines > 0:
+                w.write(b"\n" * feed_after_lines)
+            w.drain()
+            full = 4 + len(raster.buf)
+            stats = {"bytes": len(page), "full_bytes": full, "saved": full - len(page), "bands": n_graphics,
+                     "hybrid": True, "cache_hit": cached is not None, **w.throughput()}
+            settle_printer(ser_yazici, 0.2 if stats["paced"] else 0.0)
+            return stats
     clear_printer_buffer(ser_yazici)
-    send_single_esc_v_height_only(ser_yazici, raw_padded, rows=rows)
+    if store_key and 0 < len(raster.buf) <= store_capacity:
+        n = define_download_graphics(ser_yazici, raster.view, raster.device_wb * 8, raster.rows, key=store_key)
+        print_download_graphics(ser_yazici, store_key, feed_after_lines)
+        return {"bytes": n, "full_bytes": n, "saved": 0, "bands": 1, "stored": True, "cache_hit": cached is not None}
+    stats = send_single_esc_v_height_only(ser_yazici, raster.view, rows=raster.rows, blank_row=raster.white_row())
     if feed_after_lines > 0:
         ser_yazici.write(b"\n" * feed_after_lines); ser_yazici.flush()
-    time.sleep(0.2)
+    settle_printer(ser_yazici, 0.2 if stats["paced"] else 0.0)
+    stats["cache_hit"] = cached is not None
+    return stats
 
 # -------- Port keşfi --------
 def _port_matches(tokens: List[str], info) -> bool:
@@ -789,8 +2318,11 @@ class LabelApp(tk.Tk):
 
         self.ser_terazi: Optional[serial.Serial] = None
         self.ser_yazici: Optional[serial.Serial] = None
+        self.prn_download_capacity: Optional[int] = None  # indirme grafik belleği (bayt), yoksa None
 
         self.current_mrp_id: Optional[Any] = None
+        self.local_barcode_var = tk.BooleanVar(value=LOCAL_WEIGHT_BARCODE)
+        self.product_payloads: Dict[Any, Tuple[Dict[str, Any], int, Optional[str]]] = {}  # mrp_id -> (payload, copies, ürün kodu)
         self.sending_data_remote = False
         self.sending_data_local = False
         self.print_single_mode = False
@@ -800,9 +2332,11 @@ class LabelApp(tk.Tk):
         self.processed_series_tokens: set[str] = set()
         self.MAX_TOKEN_CACHE = 200
 
-        self.stable_queue: deque[int] = deque(maxlen=STABLE_COUNT)
+        self.stability = StabilityDetector()
         self.last_printed_weight: Optional[int] = None
         self.sent_last_weight: Optional[int] = None
+        # Yazıcı hatasıyla yarıda kalan tartım: (mrp_id, ağırlık, payload, kopya, basılan); aynı ağırlıkta kalınan yerden sürer
+        self.partial_print: Optional[Tuple[Any, int, Dict[str, Any], int, int]] = None
         self.weight_var = tk.StringVar(value="0 g")
         self.weight_kg_var = tk.StringVar(value="0.000 kg")
         self.stable_var = tk.StringVar(value="Kararsız")
@@ -814,6 +2348,8 @@ class LabelApp(tk.Tk):
         self.serial_parity_var = tk.StringVar(value="ODD")
         self.xonxoff_var = tk.BooleanVar(value=False)
         self.poll_mode = tk.BooleanVar(value=True)
+        self.scale_probe_pending = False   # bağlantı sonrası sürekli çıkış tespiti (ScaleWorker yapar)
+        self.scale_stream_request = False  # "Sürekli Moda Al" isteği (ScaleWorker yapar)
         self.show_raw = tk.BooleanVar(value=True)
 
         # Fiziksel (tüm sayfa) ve içerik ofsetleri
@@ -834,7 +2370,8 @@ class LabelApp(tk.Tk):
         self.job_thread.start()
         self.scale_thread.start()
 
-        self._log(f"Sans Serif -> normal: {SANS_NORMAL_PATH or '(yok)'} | bold: {SANS_BOLD_PATH or '(yok)'} | FORCE_SANS_SERIF={FORCE_SANS_SERIF}")
+        sans_normal, sans_bold = sans_serif_paths()
+        self._log(f"Sans Serif -> normal: {sans_normal or '(yok)'} | bold: {sans_bold or '(yok)'} | FORCE_SANS_SERIF={FORCE_SANS_SERIF}")
         self._log(f"Fiziksel ofset: aşağı={self.vert_mm_var.get()} mm, sola={self.horz_mm_var.get()} mm")
         self._log(f"Başlık GAP={PRODUCT_TITLE_GAP_MM:.2f} mm, Üst güvenli boşluk={PRODUCT_TITLE_TOP_SAFE_MM:.2f} mm")
         self.after(100, self._gui_pulse)
@@ -901,7 +2438,9 @@ class LabelApp(tk.Tk):
         ttk.Button(ctrl, text="Start (Yerel)", command=self._local_start, width=16).pack(padx=pad, pady=4)
         ttk.Button(ctrl, text="Done (Yerel)", command=self._local_done, width=16).pack(padx=pad, pady=4)
         ttk.Checkbutton(ctrl, text="Preview Only", variable=self.preview_only).pack(padx=pad, pady=6)
+        ttk.Checkbutton(ctrl, text="Yerel Barkod", variable=self.local_barcode_var).pack(padx=pad, pady=(0,6))
         ttk.Button(ctrl, text="3 sn Ham Oku", command=self._read_raw_3s).pack(padx=pad, pady=6)
+        ttk.Button(ctrl, text="Sürekli Moda Al", command=self._request_scale_streaming).pack(padx=pad, pady=(0,6))
 
         right = ttk.LabelFrame(self, text="Önizleme ve Kayıtlar"); right.pack(fill="both", expand=True, padx=pad, pady=(0, pad))
         self.preview_canvas = tk.Canvas(right, width=380, height=380, bg="#f2f2f2", highlightthickness=1, relief="sunken")
@@ -945,6 +2484,7 @@ class LabelApp(tk.Tk):
                 )
                 time.sleep(0.15)
                 self._log(f"Terazi bağlandı: {scl} (baud={self.ser_terazi.baudrate}, parity={self.serial_parity_var.get()}, xonxoff={self.xonxoff_var.get()}, mode={'POLL' if self.poll_mode.get() else 'LISTEN'})")
+                self.scale_probe_pending = SCL_AUTO_DETECT
             except Exception as e:
                 self._log(f"Terazi bağlanamadı ({scl}): {e}")
 
@@ -952,13 +2492,20 @@ class LabelApp(tk.Tk):
         if prn and prn != "(yok)":
             try:
                 if self.ser_yazici and self.ser_yazici.is_open: self.ser_yazici.close()
-                self.ser_yazici = serial.Serial(
-                    port=prn, baudrate=PRN_BAUD, bytesize=serial.EIGHTBITS,
-                    parity=PRN_PARITY, stopbits=serial.STOPBITS_ONE, timeout=PRN_TIMEOUT,
-                )
+                self.ser_yazici, baud_info = negotiate_printer_baud(prn)
                 time.sleep(0.1)
                 printer_handshake(self.ser_yazici)
-                self._log(f"Yazıcı bağlandı: {prn}")
+                self._log(f"Yazıcı bağlandı: {prn} (baud={baud_info}, akış kontrolü={PRN_FLOW})")
+                if probe_job_completion(self.ser_yazici):
+                    self._log("Yazıcı baskı bitişini bildiriyor (GS ( H); kopya grupları bitince baskı doğrulanacak.")
+                else:
+                    self._log("Yazıcı baskı bitişini bildirmiyor; yalnız çevrimiçi durumu beklenecek.")
+                if COPIES_BY_REFERENCE:
+                    self.prn_download_capacity = query_download_graphics_capacity(self.ser_yazici)
+                    if self.prn_download_capacity:
+                        self._log(f"İndirme grafik belleği: {self.prn_download_capacity} bayt (kopyalar referansla basılacak)")
+                    else:
+                        self._log("Yazıcı indirme grafiğini desteklemiyor; kopyalar yeniden gönderilecek.")
             except Exception as e:
                 self._log(f"Yazıcı bağlanamadı ({prn}): {e}")
 
@@ -1015,7 +2562,7 @@ class LabelApp(tk.Tk):
                     if job_str == "start":
                         self.print_single_mode = bool(job.get("print_single", False))
                         self._set_remote_stream(True, mrp_id)
-                        self.stable_queue.clear(); self.sent_last_weight = None
+                        self.stability.clear(); self.sent_last_weight = None
                         self._log(f"Odoo START: print_single={self.print_single_mode}")
                         self.last_action_id = action_id
 
@@ -1057,19 +2604,29 @@ class LabelApp(tk.Tk):
 
                         payload = {**payload_from_odoo, **payload_override}
                         if FORCE_SANS_SERIF and not payload.get("font_path"):
-                            payload["font_path"] = SANS_NORMAL_PATH
+                            payload["font_path"] = sans_serif_paths()[0]
 
                         eff_copies = copies if copies > 0 else self._compute_copies({}, resp_copies, payload)
                         eff_copies = max(1, eff_copies)
 
                         self._log(f"PRINT_SERIES: mrp_id={mrp_id}, copies={eff_copies}, delay={delay_sec}s, fixed_weight={fixed_weight}")
+                        stored = False
                         for i in range(eff_copies):
-                            self._send_label(payload)
+                            try:
+                                if stored:
+                                    self._print_stored_label()
+                                else:
+                                    stats = self._send_label(payload, store=(eff_copies > 1))
+                                    stored = bool(stats and stats.get("stored"))
+                            except PrinterNotReady:
+                                self._log(f"Seri baskı durduruldu: {i}/{eff_copies} basıldı.")
+                                break
                             self._log(f" -> {i+1}/{eff_copies} basıldı")
                             if i < eff_copies - 1:
                                 for _ in range(delay_sec * 10):
                                     if self.stop_event.is_set(): break
                                     time.sleep(0.1)
+                        self._finish_batch()
 
                         self.processed_series_tokens.add(token)
                         if len(self.processed_series_tokens) > self.MAX_TOKEN_CACHE:
@@ -1082,63 +2639,80 @@ class LabelApp(tk.Tk):
                 time.sleep(0.05)
 
     def _scale_worker(self):
-        buffer = b""
+        frames = FrameSplitter()
         while not self.stop_event.is_set():
             try:
                 if not (self.ser_terazi and self.ser_terazi.is_open):
                     time.sleep(0.2); continue
 
+                if self.scale_probe_pending or self.scale_stream_request:
+                    self._probe_scale_mode(); frames.clear()
+                    continue
+
                 if self.poll_mode.get():
-                    resp = send_ad2k_command(self.ser_terazi, b'RN\x1C', response_timeout=0.4)
-                    if resp: self._push_raw(resp)
-                    buffer += resp
+                    resp = send_ad2k_command(self.ser_terazi, b'RN\x1C', response_timeout=0.4, expect_frame=True)
                     extra = self.ser_terazi.read(self.ser_terazi.in_waiting or 0)
-                    if extra: self._push_raw(extra); buffer += extra
+                    chunk = resp + extra
                 else:
-                    chunk = self.ser_terazi.read(128)
-                    if chunk: self._push_raw(chunk); buffer += chunk
-
-                while b"\r" in buffer or b"\n" in buffer:
-                    sep = b"\r" if b"\r" in buffer else b"\n"
-                    line, buffer = buffer.split(sep, 1)
-                    if not line: continue
+                    # PUSH: okumalar geldiği anda işlenir; örnekleme hızını terazinin kendi çıkış hızı belirler
+                    chunk = read_scale_chunk(self.ser_terazi)
+                if not chunk: continue
+                self._push_raw(chunk)
 
+                for line in frames.feed(chunk):
                     weight = parse_weight_line(line)  # <- geri eklendi
                     if weight is None: continue
 
                     self._update_weight_display(weight)
-                    self.stable_queue.append(weight)
-                    is_stable = stable_value(self.stable_queue, SENSITIVITY_GRAM)  # <- geri eklendi
+                    stable_weight = self.stability.update(weight)
+                    is_stable = stable_weight is not None
                     self._set_stable(is_stable)
 
                     if not self._effective_sending(): continue
                     mrp_id = self.current_mrp_id
                     if not mrp_id or not is_stable: continue
+                    weight = stable_weight  # süzgeçten geçen değer basılır (ham okuma aykırı olabilir)
                     if self.sent_last_weight is not None and abs(self.sent_last_weight - weight) < SENSITIVITY_GRAM:
                         continue
 
-                    payload_from_odoo, resp_copies = self._fetch_label_payload_from_odoo(mrp_id, weight)
-                    if payload_from_odoo is None:
-                        self._log("Odoo payload alınamadı; baskı atlandı.")
-                        self.stable_queue.clear(); self.sent_last_weight = weight; continue
-
-                    payload = dict(payload_from_odoo)
-                    if FORCE_SANS_SERIF and not payload.get("font_path"):
-                        payload["font_path"] = SANS_NORMAL_PATH
-                    if not payload.get("product_name"):
-                        payload["product_name"] = ""
-                    if not payload.get("weight_str"):
-                        payload["weight_str"] = f"{weight/1000.0:.3f} KG"
-
-                    copies_to_print = 1 if self.print_single_mode else self._compute_copies({}, resp_copies, payload)
-                    copies_to_print = max(1, copies_to_print)
-
-                    for i in range(copies_to_print):
-                        self._send_label(payload)
-                        self._log(f"Baskı OK ({i+1}/{copies_to_print}) – {weight} g")
-                        self.last_printed_weight = weight
+                    partial, self.partial_print = self.partial_print, None
+                    if partial and partial[0] == mrp_id and abs(partial[1] - weight) < SENSITIVITY_GRAM:
+                        # Aynı ürün terazide: yarıda kalan kopyalar aynı etiketle kaldığı yerden basılır
+                        _, weight, payload, copies_to_print, done = partial
+                        self._log(f"Yarım kalan baskı sürdürülüyor ({done}/{copies_to_print}) – {weight} g")
+                    else:
+                        if partial:
+                            self._log(f"Yarım kalan baskı ({partial[4]}/{partial[3]}, {partial[1]} g) bırakıldı: ağırlık değişti.")
+                        payload_from_odoo, resp_copies = self._label_payload_for_weight(mrp_id, weight)
+                        if payload_from_odoo is None:
+                            self._log("Odoo payload alınamadı; baskı atlandı.")
+                            self.stability.clear(); self.sent_last_weight = weight; continue
 
-                    self.stable_queue.clear()
+                        payload = dict(payload_from_odoo)
+                        if FORCE_SANS_SERIF and not payload.get("font_path"):
+                            payload["font_path"] = sans_serif_paths()[0]
+                        if not payload.get("product_name"):
+                            payload["product_name"] = ""
+                        if not payload.get("weight_str"):
+                            payload["weight_str"] = format_weight_str(weight)
+
+                        copies_to_print = 1 if self.print_single_mode else self._compute_copies({}, resp_copies, payload)
+                        copies_to_print = max(1, copies_to_print)
+                        done = 0
+
+                    try:
+                        while done < copies_to_print:
+                            self._send_label(payload)
+                            done += 1
+                            self._log(f"Baskı OK ({done}/{copies_to_print}) – {weight} g")
+                            self.last_printed_weight = weight
+                    except PrinterNotReady:
+                        # Basılan kopyalar tekrar basılmaz; yazıcı hazır olunca aynı ağırlıkta kalan kopyalar gönderilir
+                        self.partial_print = (mrp_id, weight, payload, copies_to_print, done)
+                        self.stability.clear(); time.sleep(0.5); continue
+                    self._finish_batch()
+
+                    self.stability.clear()
                     self.sent_last_weight = weight
 
                     if self.print_single_mode:
@@ -1149,10 +2723,42 @@ class LabelApp(tk.Tk):
                 self._log(f"ScaleWorker hata: {e}")
                 time.sleep(0.2)
 
+    def _probe_scale_mode(self):
+        # Port yalnız ScaleWorker'dan okunur; tespit ve mod değişikliği de burada yapılır
+        ser = self.ser_terazi
+        if self.scale_stream_request:
+            self.scale_stream_request = False
+            if not SCL_STREAM_COMMAND.strip():
+                self._log("Sürekli mod komutu tanımlı değil (SCL_STREAM_COMMAND); terazi menüsünden sürekli çıkışı açın.")
+                return
+            self._log(f"Terazi sürekli moda alınıyor: {SCL_STREAM_COMMAND}")
+            streaming = enable_scale_streaming(ser)
+            if streaming is False:
+                self._log("Komuttan sonra sürekli veri gelmedi; POLL modunda kalınıyor.")
+        else:
+            self.scale_probe_pending = False
+            streaming = detect_scale_streaming(ser)
+        if streaming is None:
+            # Veri geldi ama çerçeve sayısı yetmedi: POLL'a geçmek akışı RN sorgularıyla karıştırabilir
+            self._log("Terazi çıkışı belirsiz (veri var, tam satır yok); mod seçimi değiştirilmedi.")
+            return
+        self.poll_mode.set(not streaming)
+        if streaming:
+            self._log("Terazi sürekli çıkış veriyor; PUSH (dinleme) modu.")
+        else:
+            hint = " 'Sürekli Moda Al' ile değiştirilebilir." if SCL_STREAM_COMMAND.strip() else ""
+            self._log(f"Terazi sürekli çıkış vermiyor; POLL modu.{hint}")
+
+    def _request_scale_streaming(self):
+        if not (self.ser_terazi and self.ser_terazi.is_open):
+            self._log("Sürekli mod: Terazi bağlı değil."); return
+        self.scale_stream_request = True
+
     # --- yardımcılar ---
-    def _send_label(self, payload: Dict[str, Any]):
+    def _send_label(self, payload: Dict[str, Any], store: bool = False) -> Optional[Dict[str, int]]:
+        store = store and COPIES_BY_REFERENCE and bool(self.prn_download_capacity)
         try:
-            send_label_image_to_printer(
+            stats = send_label_image_to_printer(
                 self.ser_yazici if (self.ser_yazici and self.ser_yazici.is_open) else None,
                 payload,
                 feed_after_lines=FEED_AFTER_LINES,
@@ -1160,8 +2766,48 @@ class LabelApp(tk.Tk):
                 on_preview_image=self._update_preview_image,
                 inner_dx_mm=self.inner_right_mm_var.get(),
                 inner_dy_mm=self.inner_down_mm_var.get(),
-                debug_frame=self.debug_frame_var.get()
+                debug_frame=self.debug_frame_var.get(),
+                store_key=DOWNLOAD_GRAPHICS_KEY if store else None,
+                store_capacity=self.prn_download_capacity or 0
             )
+            if stats and stats.get("saved"):
+                self._log(f"Raster: {stats['bytes']}/{stats['full_bytes']} bayt gönderildi, {stats['saved']} bayt tasarruf ({stats['bands']} bant)")
+            if stats and stats.get("bytes_per_sec"):
+                self._log(f"Hız: {stats['bytes_per_sec']} B/sn, sınır {stats['limit_bytes_per_sec']} B/sn "
+                          f"(verim %{stats['efficiency'] * 100:.0f}, akış={stats['flow']})")
+            if stats and RASTER_CACHE.max_bytes > 0:
+                cs = RASTER_CACHE.stats()
+                self._log(f"Raster önbelleği: {'isabet' if stats.get('cache_hit') else 'ıska'} "
+                          f"(oran %{cs['hit_rate'] * 100:.0f}, {cs['entries']} kayıt, {cs['bytes'] // 1024}/{cs['max_bytes'] // 1024} KB; "
+                          f"şablon oranı %{TEMPLATE_CACHE.stats()['hit_rate'] * 100:.0f})")
+            if stats and stats.get("stored"):
+                self._log(f"Raster yazıcı belleğine indirildi ({stats['bytes']} bayt); kopyalar referansla basılacak.")
+            return stats
+        except PrinterNotReady as e:
+            self._log(f"Yazıcı hazır değil: {e} — baskı gönderilmedi.")
+            raise
+        except Exception as e:
+            self._log(f"Baskı hatası: {e}")
+            return None
+
+    def _finish_batch(self) -> Optional[bool]:
+        # Kopya grubunun sonunda bir kez baskı bitişi beklenir; gönderilen kopyalar hata olsa da tekrar gönderilmez
+        if not (self.ser_yazici and self.ser_yazici.is_open) or self.preview_only.get():
+            return None
+        try:
+            return finish_print_job(self.ser_yazici)
+        except PrinterNotReady as e:
+            self._log(f"Baskı bitişi doğrulanamadı: {e} — gönderilen etiketleri kontrol edin.")
+            return False
+
+    def _print_stored_label(self):
+        try:
+            if self.ser_yazici and self.ser_yazici.is_open and not self.preview_only.get():
+                wait_printer_ready(self.ser_yazici)
+                print_download_graphics(self.ser_yazici, DOWNLOAD_GRAPHICS_KEY, FEED_AFTER_LINES)
+        except PrinterNotReady as e:
+            self._log(f"Yazıcı hazır değil: {e} — baskı gönderilmedi.")
+            raise
         except Exception as e:
             self._log(f"Baskı hatası: {e}")
 
@@ -1189,6 +2835,8 @@ class LabelApp(tk.Tk):
     def _set_remote_stream(self, enabled: bool, mrp_id: Optional[Any]):
         self.sending_data_remote = enabled
         if enabled:
+            if mrp_id != self.current_mrp_id:
+                self.product_payloads.clear()
             self.current_mrp_id = mrp_id
             self.job_status_var.set(f"Odoo START – mrp_id={mrp_id}")
         else:
@@ -1279,6 +2927,37 @@ class LabelApp(tk.Tk):
             self._log(f"Label fetch/parse error: {e}")
             return None, 1
 
+    def _label_payload_for_weight(self, mrp_id: Any, weight_grams: int) -> Tuple[Optional[Dict[str, Any]], int]:
+        """
+        Yerel barkod açıkken ürün payload'ı mrp_id başına bir kez çekilir; sonraki tartımlarda
+        weight_str ve ağırlık gömülü EAN-13 yerelde doldurulur. İlk yanıt yerel üretimle karşılaştırılır;
+        ürün kodu bulunamazsa ya da sonuç sunucudakinden farklıysa her tartımda Odoo'ya sorulur.
+        """
+        if not self.local_barcode_var.get():
+            return self._fetch_label_payload_from_odoo(mrp_id, weight_grams)
+        cached = self.product_payloads.get(mrp_id)
+        if cached is None:
+            payload, copies = self._fetch_label_payload_from_odoo(mrp_id, weight_grams)
+            if payload is None:
+                return None, copies
+            item_code = weight_item_code(payload)
+            mismatch = local_weight_mismatch(payload, item_code, weight_grams) if item_code else None
+            if mismatch:
+                item_code = None
+            self.product_payloads[mrp_id] = (payload, copies, item_code)
+            if mismatch:
+                self._log(f"mrp_id={mrp_id}: yerel etiket sunucuyla uyuşmuyor ({mismatch}); her tartım Odoo'dan alınacak.")
+            elif item_code is None:
+                self._log(f"mrp_id={mrp_id}: ürün kodu bulunamadı; yerel barkod kullanılamıyor, her tartım Odoo'dan alınacak.")
+            else:
+                self._log(f"mrp_id={mrp_id}: ürün kodu {item_code}, barkod yerelde üretilecek.")
+            return payload, copies
+        payload, copies, item_code = cached
+        barcode = weight_ean13(item_code, weight_grams) if item_code else None
+        if barcode is None:
+            return self._fetch_label_payload_from_odoo(mrp_id, weight_grams)
+        return {**payload, "weight_str": format_weight_str(weight_grams), "barcode": barcode}, copies
+
     @staticmethod
     def _compute_copies(job: Dict[str, Any], resp_copies: int, payload: Dict[str, Any]) -> int:
         if isinstance(job.get("copies"), (int, float)) and int(job["copies"]) > 0: